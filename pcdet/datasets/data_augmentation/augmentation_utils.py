@@ -27,16 +27,73 @@ def corner_to_standup_nd_jit(boxes_corner):
     return result
 
 
+@numba.njit
+def _box_pair_collision(boxes, i, qboxes, j, clockwise=True):
+    """
+    Exact collision test of boxes[i] and qboxes[j] whose standup boxes overlap: any intersection of the edges or
+    one box inside the other
+    """
+    for k in range(4):
+        for l in range(4):
+            A = boxes[i, k]
+            B = boxes[i, (k + 1) % 4]
+            C = qboxes[j, l]
+            D = qboxes[j, (l + 1) % 4]
+            acd = (D[1] - A[1]) * (C[0] - A[0]) > (
+                C[1] - A[1]) * (D[0] - A[0])
+            bcd = (D[1] - B[1]) * (C[0] - B[0]) > (
+                C[1] - B[1]) * (D[0] - B[0])
+            if acd != bcd:
+                abc = (C[1] - A[1]) * (B[0] - A[0]) > (
+                    B[1] - A[1]) * (C[0] - A[0])
+                abd = (D[1] - A[1]) * (B[0] - A[0]) > (
+                    B[1] - A[1]) * (D[0] - A[0])
+                if abc != abd:
+                    return True  # collision.
+
+    # now check complete overlap.
+    # box overlap qbox:
+    box_overlap_qbox = True
+    for l in range(4):  # point l in qboxes
+        for k in range(4):  # corner k in boxes
+            vec = boxes[i, k] - boxes[i, (k + 1) % 4]
+            if clockwise:
+                vec = -vec
+            cross = vec[1] * (
+                boxes[i, k, 0] - qboxes[j, l, 0])
+            cross -= vec[0] * (
+                boxes[i, k, 1] - qboxes[j, l, 1])
+            if cross >= 0:
+                box_overlap_qbox = False
+                break
+        if box_overlap_qbox is False:
+            break
+    if box_overlap_qbox:
+        return True  # collision.
+
+    qbox_overlap_box = True
+    for l in range(4):  # point l in boxes
+        for k in range(4):  # corner k in qboxes
+            vec = qboxes[j, k] - qboxes[j, (k + 1) % 4]
+            if clockwise:
+                vec = -vec
+            cross = vec[1] * (
+                qboxes[j, k, 0] - boxes[i, l, 0])
+            cross -= vec[0] * (
+                qboxes[j, k, 1] - boxes[i, l, 1])
+            if cross >= 0:  #
+                qbox_overlap_box = False
+                break
+        if qbox_overlap_box is False:
+            break
+    return qbox_overlap_box
+
+
 @numba.jit(nopython=True)
 def box_collision_test(boxes, qboxes, clockwise=True):
     N = boxes.shape[0]
     K = qboxes.shape[0]
     ret = np.zeros((N, K), dtype=np.bool_)
-    slices = np.array([1, 2, 3, 0])
-    lines_boxes = np.stack(
-        (boxes, boxes[:, slices, :]), axis=2)  # [N, 4, 2(line), 2(xy)]
-    lines_qboxes = np.stack((qboxes, qboxes[:, slices, :]), axis=2)
-    # vec = np.zeros((2,), dtype=boxes.dtype)
     boxes_standup = corner_to_standup_nd_jit(boxes)
     qboxes_standup = corner_to_standup_nd_jit(qboxes)
     for i in range(N):
@@ -48,68 +105,77 @@ def box_collision_test(boxes, qboxes, clockwise=True):
                 ih = (min(boxes_standup[i, 3], qboxes_standup[j, 3]) - max(
                     boxes_standup[i, 1], qboxes_standup[j, 1]))
                 if ih > 0:
-                    for k in range(4):
-                        for l in range(4):
-                            A = lines_boxes[i, k, 0]
-                            B = lines_boxes[i, k, 1]
-                            C = lines_qboxes[j, l, 0]
-                            D = lines_qboxes[j, l, 1]
-                            acd = (D[1] - A[1]) * (C[0] - A[0]) > (
-                                C[1] - A[1]) * (D[0] - A[0])
-                            bcd = (D[1] - B[1]) * (C[0] - B[0]) > (
-                                C[1] - B[1]) * (D[0] - B[0])
-                            if acd != bcd:
-                                abc = (C[1] - A[1]) * (B[0] - A[0]) > (
-                                    B[1] - A[1]) * (C[0] - A[0])
-                                abd = (D[1] - A[1]) * (B[0] - A[0]) > (
-                                    B[1] - A[1]) * (D[0] - A[0])
-                                if abc != abd:
-                                    ret[i, j] = True  # collision.
-                                    break
-                        if ret[i, j] is True:
-                            break
-                    if ret[i, j] is False:
-                        # now check complete overlap.
-                        # box overlap qbox:
-                        box_overlap_qbox = True
-                        for l in range(4):  # point l in qboxes
-                            for k in range(4):  # corner k in boxes
-                                vec = boxes[i, k] - boxes[i, (k + 1) % 4]
-                                if clockwise:
-                                    vec = -vec
-                                cross = vec[1] * (
-                                    boxes[i, k, 0] - qboxes[j, l, 0])
-                                cross -= vec[0] * (
-                                    boxes[i, k, 1] - qboxes[j, l, 1])
-                                if cross >= 0:
-                                    box_overlap_qbox = False
-                                    break
-                            if box_overlap_qbox is False:
-                                break
-
-                        if box_overlap_qbox is False:
-                            qbox_overlap_box = True
-                            for l in range(4):  # point l in boxes
-                                for k in range(4):  # corner k in qboxes
-                                    vec = qboxes[j, k] - qboxes[j, (k + 1) % 4]
-                                    if clockwise:
-                                        vec = -vec
-                                    cross = vec[1] * (
-                                        qboxes[j, k, 0] - boxes[i, l, 0])
-                                    cross -= vec[0] * (
-                                        qboxes[j, k, 1] - boxes[i, l, 1])
-                                    if cross >= 0:  #
-                                        qbox_overlap_box = False
-                                        break
-                                if qbox_overlap_box is False:
-                                    break
-                            if qbox_overlap_box:
-                                ret[i, j] = True  # collision.
-                        else:
-                            ret[i, j] = True  # collision.
+                    ret[i, j] = _box_pair_collision(boxes, i, qboxes, j, clockwise)
     return ret
 
 
+@numba.njit
+def box_collision_pairs(boxes, qboxes, clockwise=True):
+    """
+    Same collisions as box_collision_test, with a sort-and-sweep broad phase along x: only the pairs of overlapping
+    standup boxes go through the exact test, instead of all the N * K pairs
+    :param boxes: (N, 4, 2) BEV corners
+    :param qboxes: (K, 4, 2) BEV corners
+    :return: (M, 2) int64 [i, j] of the colliding pairs, i.e. the True entries of box_collision_test(boxes, qboxes)
+    """
+    N = boxes.shape[0]
+    K = qboxes.shape[0]
+    boxes_standup = corner_to_standup_nd_jit(boxes)
+    qboxes_standup = corner_to_standup_nd_jit(qboxes)
+    min_x = np.concatenate((boxes_standup[:, 0], qboxes_standup[:, 0]))
+    order = np.argsort(min_x, kind='mergesort')
+
+    # boxes whose standup box may still overlap the next ones along x
+    active_boxes = np.zeros(N, dtype=np.int64)
+    active_qboxes = np.zeros(K, dtype=np.int64)
+    num_active_boxes = 0
+    num_active_qboxes = 0
+    pairs_i = []
+    pairs_j = []
+    for idx in order:
+        cur_x = min_x[idx]
+        if idx < N:
+            i = idx
+            cnt = 0
+            for m in range(num_active_qboxes):
+                j = active_qboxes[m]
+                if qboxes_standup[j, 2] <= cur_x:
+                    continue  # iw <= 0 for this box and all the following ones
+                active_qboxes[cnt] = j
+                cnt += 1
+                iw = min(boxes_standup[i, 2], qboxes_standup[j, 2]) - max(boxes_standup[i, 0], qboxes_standup[j, 0])
+                ih = min(boxes_standup[i, 3], qboxes_standup[j, 3]) - max(boxes_standup[i, 1], qboxes_standup[j, 1])
+                if iw > 0 and ih > 0 and _box_pair_collision(boxes, i, qboxes, j, clockwise):
+                    pairs_i.append(i)
+                    pairs_j.append(j)
+            num_active_qboxes = cnt
+            active_boxes[num_active_boxes] = i
+            num_active_boxes += 1
+        else:
+            j = idx - N
+            cnt = 0
+            for m in range(num_active_boxes):
+                i = active_boxes[m]
+                if boxes_standup[i, 2] <= cur_x:
+                    continue
+                active_boxes[cnt] = i
+                cnt += 1
+                iw = min(boxes_standup[i, 2], qboxes_standup[j, 2]) - max(boxes_standup[i, 0], qboxes_standup[j, 0])
+                ih = min(boxes_standup[i, 3], qboxes_standup[j, 3]) - max(boxes_standup[i, 1], qboxes_standup[j, 1])
+                if iw > 0 and ih > 0 and _box_pair_collision(boxes, i, qboxes, j, clockwise):
+                    pairs_i.append(i)
+                    pairs_j.append(j)
+            num_active_boxes = cnt
+            active_qboxes[num_active_qboxes] = j
+            num_active_qboxes += 1
+
+    pairs = np.zeros((len(pairs_i), 2), dtype=np.int64)
+    for k in range(len(pairs_i)):
+        pairs[k, 0] = pairs_i[k]
+        pairs[k, 1] = pairs_j[k]
+    return pairs
+
+
 @numba.njit
 def _rotation_box2d_jit_(corners, angle, rot_mat_T):
     rot_sin = np.sin(angle)
@@ -146,40 +212,65 @@ def box2d_to_corner_jit(boxes):
 
 @numba.njit
 def noise_per_box(boxes, valid_mask, loc_noises, rot_noises):
-    # boxes: [N, 5]
-    # valid_mask: [N]
-    # loc_noises: [N, M, 3]
-    # rot_noises: [N, M]
+    """
+    Select the first noise of each box whose placement does not collide with the other boxes, the previous boxes are
+    already moved. All the candidate placements of a box are computed at once and only tested against the boxes
+    whose standup box overlaps the standup box of all the candidates
+    :param boxes: (N, 5) [x, y, w, l, ry]
+    :param valid_mask: (N)
+    :param loc_noises: (N, M, 3)
+    :param rot_noises: (N, M)
+    :return success_mask: (N) int64 index of the selected noise, -1 if all the placements collide
+    """
     num_boxes = boxes.shape[0]
     num_tests = loc_noises.shape[1]
     box_corners = box2d_to_corner_jit(boxes)
-    current_corners = np.zeros((4, 2), dtype=boxes.dtype)
+    box_standups = corner_to_standup_nd_jit(box_corners)
+    cand_corners = np.zeros((num_tests, 4, 2), dtype=boxes.dtype)
     rot_mat_T = np.zeros((2, 2), dtype=boxes.dtype)
+    neighbors = np.zeros((num_boxes, ), dtype=np.int64)
     success_mask = -np.ones((num_boxes, ), dtype=np.int64)
-    # print(valid_mask)
     for i in range(num_boxes):
-        if valid_mask[i]:
-            for j in range(num_tests):
-                current_corners[:] = box_corners[i]
-                current_corners -= boxes[i, :2]
-                _rotation_box2d_jit_(current_corners, rot_noises[i, j], rot_mat_T)
-                current_corners += boxes[i, :2] + loc_noises[i, j, :2]
-                coll_mat = box_collision_test(current_corners.reshape(1, 4, 2), box_corners)
-                coll_mat[0, i] = False
-                # print(coll_mat)
-                if not coll_mat.any():
-                    success_mask[i] = j
-                    box_corners[i] = current_corners
+        if not valid_mask[i]:
+            continue
+        for j in range(num_tests):
+            cand_corners[j] = box_corners[i]
+            cand_corners[j] -= boxes[i, :2]
+            _rotation_box2d_jit_(cand_corners[j], rot_noises[i, j], rot_mat_T)
+            cand_corners[j] += boxes[i, :2] + loc_noises[i, j, :2]
+        cand_standups = corner_to_standup_nd_jit(cand_corners)
+
+        min_x, min_y = cand_standups[:, 0].min(), cand_standups[:, 1].min()
+        max_x, max_y = cand_standups[:, 2].max(), cand_standups[:, 3].max()
+        num_neighbors = 0
+        for k in range(num_boxes):
+            if k != i and box_standups[k, 2] > min_x and box_standups[k, 0] < max_x \
+                    and box_standups[k, 3] > min_y and box_standups[k, 1] < max_y:
+                neighbors[num_neighbors] = k
+                num_neighbors += 1
+
+        for j in range(num_tests):
+            collision = False
+            for m in range(num_neighbors):
+                k = neighbors[m]
+                iw = min(cand_standups[j, 2], box_standups[k, 2]) - max(cand_standups[j, 0], box_standups[k, 0])
+                ih = min(cand_standups[j, 3], box_standups[k, 3]) - max(cand_standups[j, 1], box_standups[k, 1])
+                if iw > 0 and ih > 0 and _box_pair_collision(cand_corners, j, box_corners, k):
+                    collision = True
                     break
+            if not collision:
+                success_mask[i] = j
+                box_corners[i] = cand_corners[j]
+                box_standups[i] = cand_standups[j]
+                break
     return success_mask
 
 
 def _select_transform(transform, indices):
     result = np.zeros(
         (transform.shape[0], *transform.shape[2:]), dtype=transform.dtype)
-    for i in range(transform.shape[0]):
-        if indices[i] != -1:
-            result[i] = transform[i, indices[i]]
+    selected = np.where(indices != -1)[0]
+    result[selected] = transform[selected, indices[selected]]
     return result
 
 
@@ -193,44 +284,43 @@ def box3d_transform_(boxes, loc_transform, rot_transform, valid_mask):
 
 
 @numba.njit
-def _rotation_matrix_3d_(rot_mat_T, angle, axis):
-    rot_sin = np.sin(angle)
-    rot_cos = np.cos(angle)
-    rot_mat_T[:] = np.eye(3)
-    if axis == 1:
-        rot_mat_T[0, 0] = rot_cos
-        rot_mat_T[0, 2] = -rot_sin
-        rot_mat_T[2, 0] = rot_sin
-        rot_mat_T[2, 2] = rot_cos
-    elif axis == 2 or axis == -1:
-        rot_mat_T[0, 0] = rot_cos
-        rot_mat_T[0, 1] = -rot_sin
-        rot_mat_T[1, 0] = rot_sin
-        rot_mat_T[1, 1] = rot_cos
-    elif axis == 0:
-        rot_mat_T[1, 1] = rot_cos
-        rot_mat_T[1, 2] = -rot_sin
-        rot_mat_T[2, 1] = rot_sin
-        rot_mat_T[2, 2] = rot_cos
-
-
-@numba.njit
-def points_transform_(points, centers, point_masks, loc_transform,
-                      rot_transform, valid_mask):
+def points_transform_(points, centers, point_owners, loc_transform, rot_transform, valid_mask,
+                      num_boxes_of_pts, num_boxes_of_pts_dst):
+    """
+    Move the points with their owner boxes and compute the drop mask in one pass over the points
+    :param points: (M, 3 + C), modified in place
+    :param centers: (N, 3) bottom centers of the boxes before the noise
+    :param point_owners: (M) index of the box that moves each point, -1 for background
+    :param loc_transform: (N, 3)
+    :param rot_transform: (N) rotation around z
+    :param valid_mask: (N)
+    :param num_boxes_of_pts: (M) number of boxes before the noise that contain each point
+    :param num_boxes_of_pts_dst: (M) number of boxes after the noise that contain each point
+    :return keep_mask: (M) False for the background points covered by a moved box
+    """
     num_box = centers.shape[0]
     num_points = points.shape[0]
-    rot_mat_T = np.zeros((num_box, 3, 3), dtype=points.dtype)
-    for i in range(num_box):
-        _rotation_matrix_3d_(rot_mat_T[i], rot_transform[i], 2)
+    rot_cos = np.zeros((num_box, ), dtype=points.dtype)
+    rot_sin = np.zeros((num_box, ), dtype=points.dtype)
+    for j in range(num_box):
+        rot_cos[j] = np.cos(rot_transform[j])
+        rot_sin[j] = np.sin(rot_transform[j])
+    local_xyz = np.zeros((3, ), dtype=points.dtype)
+    keep_mask = np.ones((num_points, ), dtype=np.bool_)
     for i in range(num_points):
-        for j in range(num_box):
-            if valid_mask[j]:
-                if point_masks[i, j] == 1:
-                    points[i, :3] -= centers[j, :3]
-                    points[i:i + 1, :3] = points[i:i + 1, :3] @ rot_mat_T[j]
-                    points[i, :3] += centers[j, :3]
-                    points[i, :3] += loc_transform[j]
-                    break  # only apply first box's transform
+        keep_mask[i] = not (num_boxes_of_pts_dst[i] == 1 and num_boxes_of_pts[i] == 0)
+        j = point_owners[i]
+        if j >= 0 and valid_mask[j]:
+            for k in range(3):
+                local_xyz[k] = points[i, k] - centers[j, k]
+            # local_xyz @ [[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]]
+            points[i, 0] = local_xyz[0] * rot_cos[j] + local_xyz[1] * rot_sin[j]
+            points[i, 1] = local_xyz[1] * rot_cos[j] - local_xyz[0] * rot_sin[j]
+            points[i, 2] = local_xyz[2]
+            for k in range(3):
+                points[i, k] += centers[j, k]
+                points[i, k] += loc_transform[j, k]
+    return keep_mask
 
 
 def noise_per_object_v3_(gt_boxes, points=None, valid_mask=None, rotation_perturb=np.pi / 4, center_noise_std=1.0,
@@ -264,17 +354,26 @@ def noise_per_object_v3_(gt_boxes, points=None, valid_mask=None, rotation_pertur
     box3d_transform_(gt_boxes, loc_transforms, rot_transforms, valid_mask)
     if points is not None:
         # mark points in noised position
-        point_masks_dst = roiaware_pool3d_utils.points_in_boxes_cpu(
-            torch.from_numpy(points[:, :3]), torch.from_numpy(gt_boxes)
-        ).numpy().transpose()  # (num_points, num_boxes)
-
-        point_masks = roiaware_pool3d_utils.points_in_boxes_cpu(
-            torch.from_numpy(points[:, :3]), torch.from_numpy(gt_boxes_before_noise)
-        ).numpy().transpose()  # (num_points, num_boxes)
-
-        points_transform_(points, gt_boxes_before_noise[:, :3], point_masks, loc_transforms, rot_transforms, valid_mask)
-
-        keep_mask = np.logical_not((point_masks_dst.sum(axis=1) == 1) & (point_masks.sum(axis=1) == 0))
+        _, num_boxes_of_pts_dst = roiaware_pool3d_utils.points_in_boxes_idx_cpu(
+            torch.from_numpy(points[:, :3]), torch.from_numpy(gt_boxes), return_counts=True
+        )
+        point_owners, num_boxes_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(
+            torch.from_numpy(points[:, :3]), torch.from_numpy(gt_boxes_before_noise), return_counts=True
+        )
+        num_boxes_of_pts_dst, point_owners, num_boxes_of_pts = \
+            num_boxes_of_pts_dst.numpy(), point_owners.numpy(), num_boxes_of_pts.numpy()
+
+        if not valid_mask.all():
+            # each point moves with the first valid box that contains it
+            valid_box_idxs = np.where(valid_mask)[0]
+            valid_owners = roiaware_pool3d_utils.points_in_boxes_idx_cpu(
+                torch.from_numpy(points[:, :3]), torch.from_numpy(gt_boxes_before_noise[valid_mask])
+            ).numpy()
+            point_owners = -np.ones_like(valid_owners)
+            point_owners[valid_owners >= 0] = valid_box_idxs[valid_owners[valid_owners >= 0]]
+
+        keep_mask = points_transform_(points, gt_boxes_before_noise[:, :3], point_owners, loc_transforms,
+                                      rot_transforms, valid_mask, num_boxes_of_pts, num_boxes_of_pts_dst)
         points = points[keep_mask]
 
     return gt_boxes, points
@@ -308,3 +407,123 @@ def global_scaling(gt_boxes, points, min_scale=0.95, max_scale=1.05):
     gt_boxes[:, :6] *= noise_scale
     return gt_boxes, points
 
+
+def get_global_transform(flip_probability=0.5, rotation=np.pi / 4, min_scale=0.95, max_scale=1.05,
+                         flip_x_probability=0.0, translation_std=None):
+    """
+    Sample random_flip, global_rotation and global_scaling with the same random draws, the flips and the rotation are
+    composed into one matrix. The optional flip along x and translation are drawn after them, the flip along x is still
+    applied before the rotation
+    :param flip_probability: probability of y -> -y
+    :param rotation: float or [min, max], rotation around z
+    :param min_scale:
+    :param max_scale:
+    :param flip_x_probability: probability of x -> -x
+    :param translation_std: optional, float or [std_x, std_y, std_z]
+    :return transform: dict
+        rot_mat: (2, 2) flips and rotation, xy @ rot_mat
+        heading_sign, heading_offset: the flips map the heading ry to ry * heading_sign + heading_offset
+        rotation: rotation added to the heading
+        scale: float
+        translation: (3) or None, added after the scaling
+    """
+    flip_mat = np.eye(2)
+    heading_sign, heading_offset = 1.0, 0.0
+    enable = np.random.choice([False, True], replace=False, p=[1 - flip_probability, flip_probability])
+    if enable:
+        flip_mat[:, 1] = -flip_mat[:, 1]
+        heading_sign, heading_offset = -heading_sign, np.pi - heading_offset
+
+    if not isinstance(rotation, list):
+        rotation = [-rotation, rotation]
+    noise_rotation = np.random.uniform(rotation[0], rotation[1])
+
+    noise_scale = 1.0
+    if max_scale - min_scale >= 1e-3:
+        noise_scale = np.random.uniform(min_scale, max_scale)
+
+    if flip_x_probability > 0:
+        enable = np.random.choice([False, True], replace=False, p=[1 - flip_x_probability, flip_x_probability])
+        if enable:
+            flip_mat[:, 0] = -flip_mat[:, 0]
+            heading_sign, heading_offset = -heading_sign, -heading_offset
+
+    cosval, sinval = np.cos(noise_rotation), np.sin(noise_rotation)
+    rot_mat = np.dot(flip_mat, np.array([[cosval, -sinval], [sinval, cosval]]))
+
+    noise_translation = None
+    if translation_std is not None:
+        if not isinstance(translation_std, (list, tuple, np.ndarray)):
+            translation_std = [translation_std, translation_std, translation_std]
+        noise_translation = np.random.normal(scale=translation_std, size=3)
+
+    return {'rot_mat': rot_mat, 'heading_sign': heading_sign, 'heading_offset': heading_offset,
+            'rotation': noise_rotation, 'scale': noise_scale, 'translation': noise_translation}
+
+
+@numba.njit
+def _global_transform_points_kernel_(points, rot_mat, scale, translation, use_translation):
+    for i in range(points.shape[0]):
+        x, y = points[i, 0], points[i, 1]
+        points[i, 0] = x * rot_mat[0, 0] + y * rot_mat[1, 0]
+        points[i, 1] = x * rot_mat[0, 1] + y * rot_mat[1, 1]
+        for k in range(3):
+            points[i, k] *= scale
+            if use_translation:
+                points[i, k] += translation[k]
+
+
+def global_transform_(gt_boxes, points, transform):
+    """
+    Same results as random_flip, global_rotation and global_scaling applied one after another with the same random
+    draws, the points are transformed in place in a single pass
+    :param gt_boxes: (N, 7 + C) [x, y, z, w, l, h, rz, ...]
+    :param points: (M, 3 + C)
+    :param transform: dict from get_global_transform
+    :return: gt_boxes, points
+    """
+    use_translation = transform['translation'] is not None
+    translation = transform['translation'] if use_translation else np.zeros(3)
+    _global_transform_points_kernel_(points, transform['rot_mat'], points.dtype.type(transform['scale']),
+                                     translation, use_translation)
+
+    # only a few boxes, transformed by numpy as in rotate_pc_along_z
+    gt_boxes[:, 0:2] = np.dot(gt_boxes[:, 0:2], transform['rot_mat'])
+    if transform['heading_sign'] != 1.0 or transform['heading_offset'] != 0.0:
+        gt_boxes[:, 6] = gt_boxes[:, 6] * transform['heading_sign'] + transform['heading_offset']
+    gt_boxes[:, 6] += transform['rotation']
+    gt_boxes[:, :6] *= transform['scale']
+    if use_translation:
+        gt_boxes[:, 0:3] += translation
+    return gt_boxes, points
+
+
+if __name__ == '__main__':
+    import time
+
+    # dense urban scene: 60 gt boxes and the 35 boxes of the sample groups in front of the car
+    np.random.seed(0)
+    num_gt, num_sampled = 60, 35
+    boxes2d = np.concatenate((
+        np.random.uniform([0, -40], [70.4, 40], size=(num_gt + num_sampled, 2)),
+        np.random.uniform([0.6, 0.8], [1.9, 4.5], size=(num_gt + num_sampled, 2)),
+        np.random.uniform(-np.pi, np.pi, size=(num_gt + num_sampled, 1))
+    ), axis=1)
+    total_bv = box2d_to_corner_jit(boxes2d)
+    box_collision_test(total_bv[:2], total_bv[:2]), box_collision_pairs(total_bv[:2], total_bv[:2])  # jit compilation
+
+    t1 = time.time()
+    for _ in range(100):
+        coll_mat = box_collision_test(total_bv, total_bv)
+    t2 = time.time()
+    for _ in range(100):
+        coll_pairs = box_collision_pairs(total_bv[num_gt:], total_bv[:num_gt])
+        sp_coll_pairs = box_collision_pairs(total_bv[num_gt:], total_bv[num_gt:])
+    t3 = time.time()
+    print('all-pairs collision matrix: %.3fms, broad phase: %.3fms, %d collisions'
+          % ((t2 - t1) * 10, (t3 - t2) * 10, coll_pairs.shape[0] + sp_coll_pairs.shape[0]))
+
+    coll_mat_pairs = np.zeros_like(coll_mat)
+    coll_mat_pairs[coll_pairs[:, 0] + num_gt, coll_pairs[:, 1]] = True
+    coll_mat_pairs[sp_coll_pairs[:, 0] + num_gt, sp_coll_pairs[:, 1] + num_gt] = True
+    assert (coll_mat_pairs[num_gt:] == coll_mat[num_gt:]).all()
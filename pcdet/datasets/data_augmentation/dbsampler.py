@@ -1,11 +1,18 @@
 # This file is modified from https://github.com/traveller59/second.pytorch
 
 import numpy as np
-import copy
 import os
-from ...utils import common_utils, box_utils
+import pickle
+from pathlib import Path
+from ...utils import common_utils, box_utils, point_quant_utils, sample_cache_utils
 from . import augmentation_utils
 
+# the fields of the db infos used by the sampling, one structured array per class instead of a list of dicts
+DB_INFO_DTYPE = np.dtype([
+    ('box3d_lidar', '<f8', (7, )), ('num_points_in_gt', '<i8'), ('difficulty', '<i4'),
+    ('path_idx', '<i4'), ('point_offset', '<i8'), ('rot_transform', '<f8')
+])
+
 
 class BatchSampler:
     def __init__(self, sampled_list, name=None, epoch=None, shuffle=True, drop_reminder=False):
@@ -36,24 +43,26 @@ class BatchSampler:
         self._idx = 0
 
     def sample(self, num):
-        indices = self._sample(num)
-        return [self._sampled_list[i] for i in indices]
+        """
+        :return indices: (num) int64 indices of the sampled list
+        """
+        return np.array(self._sample(num))
 
 
 class DataBaseSampler(object):
     def __init__(self, db_infos, sampler_cfg, class_names, logger=None):
+        """
+        :param db_infos: dict of class name -> list of db_info dicts, filtered by sampler_cfg.PREPARE here,
+            or the already filtered (db_arrays, db_paths) of load_db_infos
+        :param sampler_cfg: cfg.DATA_CONFIG.AUGMENTATION.DB_SAMPLER
+        :param class_names:
+        :param logger:
+        """
         super().__init__()
 
-        if logger is not None:
-            for k, v in db_infos.items():
-                logger.info('Database before filter %s: %d' % (k, len(v)))
-        for prep_func, val in sampler_cfg.PREPARE.items():
-            db_infos = getattr(self, prep_func)(db_infos, val)
-        if logger is not None:
-            for k, v in db_infos.items():
-                logger.info('Database after filter %s: %d' % (k, len(v)))
-
-        self.db_infos = db_infos
+        if not isinstance(db_infos, tuple):
+            db_infos = self.prepare_db_infos(db_infos, sampler_cfg.PREPARE, logger=logger)
+        self.db_infos, self.db_paths = db_infos
         self.rate = sampler_cfg.RATE
         self.sample_groups = []
         for x in sampler_cfg.SAMPLE_GROUPS:
@@ -73,14 +82,148 @@ class DataBaseSampler(object):
         for k, v in self.group_db_infos.items():
             self.sampler_dict[k] = BatchSampler(v, k, shuffle=True)
 
+        self._db_data = {}  # packed gt database file -> memmap, opened lazily in each process
+        self.use_quantized_points = sampler_cfg.get('USE_QUANTIZED_POINTS', False)
+        self._quant_resolution = None
+
+    @staticmethod
+    def db_infos_to_arrays(db_infos):
+        """
+        :param db_infos: dict of class name -> list of db_info dicts
+        :return:
+            db_arrays: dict of class name -> (N) DB_INFO_DTYPE
+            db_paths: list of the point files of the db infos, indexed by path_idx
+        """
+        path_to_idx = {}
+        db_arrays = {}
+        for name, infos in db_infos.items():
+            db_array = np.zeros(len(infos), dtype=DB_INFO_DTYPE)
+            if len(infos) > 0:
+                db_array['box3d_lidar'] = np.array([x['box3d_lidar'] for x in infos]).reshape(-1, 7)
+                db_array['num_points_in_gt'] = [x['num_points_in_gt'] for x in infos]
+                db_array['difficulty'] = [x['difficulty'] for x in infos]
+                db_array['path_idx'] = [path_to_idx.setdefault(x['path'], len(path_to_idx)) for x in infos]
+                db_array['point_offset'] = [x.get('point_offset', -1) for x in infos]
+                db_array['rot_transform'] = [x.get('rot_transform', np.nan) for x in infos]
+            db_arrays[name] = db_array
+        return db_arrays, list(path_to_idx.keys())
+
+    @staticmethod
+    def prepare_db_infos(db_infos, prepare_cfg, logger=None):
+        """
+        :param db_infos: dict of class name -> list of db_info dicts
+        :param prepare_cfg: sampler_cfg.PREPARE, filter function name -> its argument
+        :return: db_arrays, db_paths
+        """
+        db_arrays, db_paths = DataBaseSampler.db_infos_to_arrays(db_infos)
+        if logger is not None:
+            for k, v in db_arrays.items():
+                logger.info('Database before filter %s: %d' % (k, len(v)))
+        for prep_func, val in prepare_cfg.items():
+            db_arrays = getattr(DataBaseSampler, prep_func)(db_arrays, val)
+        if logger is not None:
+            for k, v in db_arrays.items():
+                logger.info('Database after filter %s: %d' % (k, len(v)))
+        return db_arrays, db_paths
+
+    @staticmethod
+    def load_db_infos(db_info_paths, prepare_cfg, logger=None):
+        """
+        Load and filter the db infos, the result is cached next to the first db info file and keyed by the
+        PREPARE config and the size / modification time of the db info files, the stale caches are removed
+        :param db_info_paths: list of the db info .pkl files, the classes of the first one are used
+        :param prepare_cfg: sampler_cfg.PREPARE
+        :return: db_arrays, db_paths
+        """
+        db_info_paths = [Path(x) for x in db_info_paths]
+        file_signatures = [(str(x), x.stat().st_size, x.stat().st_mtime_ns) for x in db_info_paths]
+        config_hash = sample_cache_utils.get_config_hash(prepare_cfg, file_signatures)
+        cache_file = db_info_paths[0].parent / ('%s_prepared_%s.pkl' % (db_info_paths[0].stem, config_hash))
+        if cache_file.exists():
+            with open(cache_file, 'rb') as f:
+                db_arrays, db_paths = pickle.load(f)
+            if logger is not None:
+                logger.info('Load the filtered database from %s' % cache_file)
+                for k, v in db_arrays.items():
+                    logger.info('Database after filter %s: %d' % (k, len(v)))
+            return db_arrays, db_paths
+
+        db_infos = []
+        for db_info_path in db_info_paths:
+            with open(str(db_info_path), 'rb') as f:
+                infos = pickle.load(f)
+                if db_infos.__len__() == 0:
+                    db_infos = infos
+                else:
+                    [db_infos[cls].extend(infos[cls]) for cls in db_infos.keys()]
+        db_arrays, db_paths = DataBaseSampler.prepare_db_infos(db_infos, prepare_cfg, logger=logger)
+
+        # the DataLoader workers or the other ranks may write the same cache at the same time
+        tmp_file = cache_file.with_suffix('.pkl.tmp.%d' % os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((db_arrays, db_paths), f)
+        os.replace(tmp_file, cache_file)
+
+        # remove the caches of the previous PREPARE configs and db info files
+        for stale_file in cache_file.parent.glob('%s_prepared_*.pkl' % db_info_paths[0].stem):
+            if stale_file != cache_file:
+                try:
+                    stale_file.unlink()
+                except FileNotFoundError:
+                    continue  # removed by another worker or rank
+                if logger is not None:
+                    logger.info('Remove the stale filtered database %s' % stale_file)
+        return db_arrays, db_paths
+
+    def __getstate__(self):
+        # memmaps are re-opened in each DataLoader worker instead of being pickled
+        state = self.__dict__.copy()
+        state['_db_data'] = {}
+        return state
+
+    def get_db_points(self, root_path, info, num_point_features=4):
+        """
+        :param info: DB_INFO_DTYPE record, point_offset is -1 if it is not in a packed gt database
+        :return s_points: (num_points_in_gt, num_point_features), writable copy
+        """
+        if self.use_quantized_points:
+            return self.get_quantized_db_points(root_path, info, num_point_features)
+
+        file_path = os.path.join(root_path, self.db_paths[info['path_idx']])
+        if info['point_offset'] < 0:
+            return np.fromfile(file_path, dtype=np.float32).reshape([-1, num_point_features])
+
+        if file_path not in self._db_data:
+            db_data = np.memmap(file_path, dtype=np.float32, mode='r')
+            self._db_data[file_path] = db_data.reshape([-1, num_point_features])
+        point_offset = info['point_offset']
+        return np.array(self._db_data[file_path][point_offset:point_offset + info['num_points_in_gt']])
+
+    def get_quantized_db_points(self, root_path, info, num_point_features=4):
+        """
+        same as get_db_points, but reads the files converted by create_kitti_quantized_points
+        """
+        assert num_point_features == 4
+        quant_dir = os.path.join(root_path, 'gt_database_quant')
+        if self._quant_resolution is None:
+            self._quant_resolution = point_quant_utils.get_quantized_resolution(quant_dir)
+            assert self._quant_resolution is not None, 'Please convert the gt database by create_kitti_quantized_points'
+
+        file_path = os.path.join(quant_dir, os.path.basename(self.db_paths[info['path_idx']]))
+        if info['point_offset'] < 0:
+            return point_quant_utils.load_quantized_points(file_path, self._quant_resolution)
+
+        if file_path not in self._db_data:
+            self._db_data[file_path] = np.memmap(file_path, dtype=point_quant_utils.QUANTIZED_POINT_DTYPE, mode='r')
+        point_offset = info['point_offset']
+        qpoints = self._db_data[file_path][point_offset:point_offset + info['num_points_in_gt']]
+        return point_quant_utils.dequantize_points(qpoints, self._quant_resolution)
+
     @staticmethod
     def filter_by_difficulty(db_infos, removed_difficulty):
         new_db_infos = {}
         for key, dinfos in db_infos.items():
-            new_db_infos[key] = [
-                info for info in dinfos
-                if info['difficulty'] not in removed_difficulty
-            ]
+            new_db_infos[key] = dinfos[~np.isin(dinfos['difficulty'], removed_difficulty)]
         return new_db_infos
 
     @staticmethod
@@ -89,22 +232,14 @@ class DataBaseSampler(object):
             name, min_num = name_num.split(':')
             min_num = int(min_num)
             if min_num > 0:
-                filtered_infos = []
-                for info in db_infos[name]:
-                    if info['num_points_in_gt'] >= min_num:
-                        filtered_infos.append(info)
-                db_infos[name] = filtered_infos
+                db_infos[name] = db_infos[name][db_infos[name]['num_points_in_gt'] >= min_num]
         return db_infos
 
     @staticmethod
     def filter_by_frontview(db_infos, front_dist_list):
         for name_num in front_dist_list:
             name, front_dist = name_num.split(':')
-            filtered_infos = []
-            for info in db_infos[name]:
-                if info['box3d_lidar'][0] >= 0:
-                    filtered_infos.append(info)
-            db_infos[name] = filtered_infos
+            db_infos[name] = db_infos[name][db_infos[name]['box3d_lidar'][:, 0] >= 0]
         return db_infos
 
     def sample_all(self, root_path, gt_boxes, gt_names, num_point_features=4,
@@ -117,26 +252,30 @@ class DataBaseSampler(object):
             sampled_num_dict[class_name] = sampled_num
             sample_num_per_class.append(sampled_num)
 
-        sampled = []
+        sampled, sampled_names = [], []
         sampled_gt_boxes = []
         avoid_coll_boxes = gt_boxes
+        # the corners of the gt boxes and of the accepted boxes are computed only once for all the classes
+        avoid_coll_boxes_bv = box_utils.boxes3d_to_corners3d_lidar(gt_boxes)[:, 0:4, 0:2]
 
         for class_name, sampled_num in zip(self.sample_classes, sample_num_per_class):
             if sampled_num > 0:
-                sampled_cls = self.sample_class_v2(class_name, sampled_num, avoid_coll_boxes)
-
-                sampled += sampled_cls
-                if len(sampled_cls) > 0:
-                    if len(sampled_cls) == 1:
-                        sampled_gt_box = sampled_cls[0]['box3d_lidar'][np.newaxis, ...]
-                    else:
-                        sampled_gt_box = np.stack([s['box3d_lidar'] for s in sampled_cls], axis=0)
+                sampled_idxs = self.sample_class_v2(class_name, sampled_num, avoid_coll_boxes, avoid_coll_boxes_bv)
 
+                if len(sampled_idxs) > 0:
+                    sampled_cls = self.db_infos[class_name][sampled_idxs]
+                    sampled_gt_box = sampled_cls['box3d_lidar']
+                    sampled.append(sampled_cls)
+                    sampled_names.append(np.full(len(sampled_cls), class_name))
                     sampled_gt_boxes += [sampled_gt_box]
                     avoid_coll_boxes = np.concatenate([avoid_coll_boxes, sampled_gt_box], axis=0)
+                    avoid_coll_boxes_bv = np.concatenate(
+                        [avoid_coll_boxes_bv, box_utils.boxes3d_to_corners3d_lidar(sampled_gt_box)[:, 0:4, 0:2]], axis=0
+                    )
 
         ret = None
         if len(sampled) > 0:
+            sampled = np.concatenate(sampled, axis=0)
             sampled_gt_boxes = np.concatenate(sampled_gt_boxes, axis=0)
             center = sampled_gt_boxes[:, 0:3]
 
@@ -154,53 +293,58 @@ class DataBaseSampler(object):
 
             num_sampled = len(sampled)
             s_points_list = []
-            count = 0
             for info in sampled:
-                file_path = os.path.join(root_path, info['path'])
-                s_points = np.fromfile(file_path, dtype=np.float32).reshape([-1, num_point_features])
+                s_points = self.get_db_points(root_path, info, num_point_features=num_point_features)
 
-                if 'rot_transform' in info:
+                if not np.isnan(info['rot_transform']):
                     rot = info['rot_transform']
                     s_points = common_utils.rotate_pc_along_z(s_points, rot)
                 s_points[:, :3] += info['box3d_lidar'][:3]
-
-                if road_planes is not None:
-                    # mv height
-                    s_points[:, 2] -= mv_height[count]
-                count += 1
-
                 s_points_list.append(s_points)
+            s_points = np.concatenate(s_points_list, axis=0)
+
+            if road_planes is not None:
+                # mv height of the points of all the sampled boxes at once
+                s_points[:, 2] -= np.repeat(mv_height, [x.shape[0] for x in s_points_list]).astype(s_points.dtype)
 
-            ret = {'gt_names': np.array([s['name'] for s in sampled]),
-                   'difficulty': np.array([s['difficulty'] for s in sampled]), 'gt_boxes': sampled_gt_boxes,
-                   'points': np.concatenate(s_points_list, axis=0), 'gt_masks': np.ones((num_sampled,), dtype=np.bool_),
+            ret = {'gt_names': np.concatenate(sampled_names, axis=0),
+                   'difficulty': sampled['difficulty'], 'gt_boxes': sampled_gt_boxes,
+                   'points': s_points, 'gt_masks': np.ones((num_sampled,), dtype=np.bool_),
                    'group_ids': np.arange(gt_boxes.shape[0], gt_boxes.shape[0] + len(sampled))}
 
         return ret
 
-    def sample_class_v2(self, name, num, gt_boxes):
-        sampled = self.sampler_dict[name].sample(num)
-        sampled = copy.deepcopy(sampled)
-        num_gt = gt_boxes.shape[0]
-        num_sampled = len(sampled)
-        gt_boxes_bv = box_utils.boxes3d_to_corners3d_lidar(gt_boxes)[:, 0:4, 0:2]  # (N, 4, 2)
-
-        sp_boxes = np.stack([i['box3d_lidar'] for i in sampled], axis=0)
-        boxes = np.concatenate([gt_boxes, sp_boxes], axis=0).copy()
-
-        sp_boxes_new = boxes[gt_boxes.shape[0]:]
-        sp_boxes_bv = box_utils.boxes3d_to_corners3d_lidar(sp_boxes_new)[:, 0:4, 0:2]  # (N, 4, 2)
-
-        total_bv = np.concatenate([gt_boxes_bv, sp_boxes_bv], axis=0)
-        coll_mat = augmentation_utils.box_collision_test(total_bv, total_bv)
-        diag = np.arange(total_bv.shape[0])
-        coll_mat[diag, diag] = False
-
-        valid_samples = []
-        for i in range(num_gt, num_gt + num_sampled):
-            if coll_mat[i].any():
-                coll_mat[i] = False
-                coll_mat[:, i] = False
-            else:
-                valid_samples.append(sampled[i - num_gt])
-        return valid_samples
+    def sample_class_v2(self, name, num, gt_boxes, gt_boxes_bv=None):
+        """
+        Sample the boxes of one class and drop the ones colliding with gt_boxes, the accepted boxes or the following
+        sampled boxes, in the sampling order
+        :param name: class name
+        :param num: int, number of boxes to sample
+        :param gt_boxes: (N, 7) the boxes to avoid
+        :param gt_boxes_bv: optional, (N, 4, 2) BEV corners of gt_boxes
+        :return: (K) int64 indices of the accepted boxes in self.db_infos[name]
+        """
+        sampled_idxs = self.sampler_dict[name].sample(num)
+        num_sampled = len(sampled_idxs)
+        if gt_boxes_bv is None:
+            gt_boxes_bv = box_utils.boxes3d_to_corners3d_lidar(gt_boxes)[:, 0:4, 0:2]  # (N, 4, 2)
+
+        sp_boxes = self.db_infos[name]['box3d_lidar'][sampled_idxs]
+        sp_boxes_bv = box_utils.boxes3d_to_corners3d_lidar(sp_boxes)[:, 0:4, 0:2]  # (M, 4, 2)
+
+        # only the colliding pairs are computed instead of the (N + M) x (N + M) collision matrix
+        gt_coll_pairs = augmentation_utils.box_collision_pairs(sp_boxes_bv, gt_boxes_bv)
+        sp_coll_pairs = augmentation_utils.box_collision_pairs(sp_boxes_bv, sp_boxes_bv)
+        sp_coll_pairs = sp_coll_pairs[sp_coll_pairs[:, 0] != sp_coll_pairs[:, 1]]
+
+        valid_mask = np.ones(num_sampled, dtype=np.bool_)
+        valid_mask[gt_coll_pairs[:, 0]] = False
+        coll_idxs = [[] for _ in range(num_sampled)]
+        for i, j in sp_coll_pairs:
+            coll_idxs[i].append(j)
+
+        # accepted incrementally: a dropped box does not collide with the following ones anymore
+        for i in range(num_sampled):
+            if valid_mask[i] and not all([j < i and not valid_mask[j] for j in coll_idxs[i]]):
+                valid_mask[i] = False
+        return sampled_idxs[valid_mask]
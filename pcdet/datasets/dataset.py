@@ -92,8 +92,10 @@ class DatasetTemplate(torch_data.Dataset):
             gt_boxes_mask = np.array([n in self.class_names for n in gt_names], dtype=np.bool_)
 
             if self.db_sampler is not None:
-                road_planes = self.get_road_plane(sample_idx) \
-                    if cfg.DATA_CONFIG.AUGMENTATION.DB_SAMPLER.USE_ROAD_PLANE else None
+                road_planes = None
+                if cfg.DATA_CONFIG.AUGMENTATION.DB_SAMPLER.USE_ROAD_PLANE:
+                    road_planes = input_dict['road_plane'] if 'road_plane' in input_dict \
+                        else self.get_road_plane(sample_idx)
                 sampled_dict = self.db_sampler.sample_all(
                     self.root_path, gt_boxes, gt_names, road_planes=road_planes,
                     num_point_features=cfg.DATA_CONFIG.NUM_POINT_FEATURES['total'], calib=calib
@@ -131,13 +133,15 @@ class DatasetTemplate(torch_data.Dataset):
 
             noise_global_scene = cfg.DATA_CONFIG.AUGMENTATION.NOISE_GLOBAL_SCENE
             if noise_global_scene.ENABLED:
-                gt_boxes, points = augmentation_utils.random_flip(gt_boxes, points)
-                gt_boxes, points = augmentation_utils.global_rotation(
-                    gt_boxes, points, rotation=noise_global_scene.GLOBAL_ROT_UNIFORM_NOISE
-                )
-                gt_boxes, points = augmentation_utils.global_scaling(
-                    gt_boxes, points, *noise_global_scene.GLOBAL_SCALING_UNIFORM_NOISE
+                # flip, rotation and scaling in one pass over the points
+                global_transform = augmentation_utils.get_global_transform(
+                    rotation=noise_global_scene.GLOBAL_ROT_UNIFORM_NOISE,
+                    min_scale=noise_global_scene.GLOBAL_SCALING_UNIFORM_NOISE[0],
+                    max_scale=noise_global_scene.GLOBAL_SCALING_UNIFORM_NOISE[1],
+                    flip_x_probability=noise_global_scene.get('FLIP_X_PROBABILITY', 0.0),
+                    translation_std=noise_global_scene.get('GLOBAL_TRANSLATION_NOISE_STD', None)
                 )
+                gt_boxes, points = augmentation_utils.global_transform_(gt_boxes, points, global_transform)
 
             pc_range = self.voxel_generator.point_cloud_range
             mask = box_utils.mask_boxes_outside_range(gt_boxes, pc_range)
@@ -215,39 +219,45 @@ class DatasetTemplate(torch_data.Dataset):
         GT_EXTEND_WIDTH = unet_target_cfg.GT_EXTEND_WIDTH
 
         extend_gt_boxes = common_utils.enlarge_box3d(gt_boxes, extra_width=GT_EXTEND_WIDTH)
-        gt_corners = box_utils.boxes3d_to_corners3d_lidar(gt_boxes)
-        extend_gt_corners = box_utils.boxes3d_to_corners3d_lidar(extend_gt_boxes)
+        # the index of the last box that contains each point, as the per-box loop lets the later boxes win
+        num_boxes = gt_boxes.shape[0]
+        box_idxs = box_utils.points_in_boxes_idx(voxel_centers, gt_boxes[::-1])
+        extend_box_idxs = box_utils.points_in_boxes_idx(voxel_centers, extend_gt_boxes[::-1])
+        box_idxs = np.where(box_idxs >= 0, num_boxes - 1 - box_idxs, box_idxs)
+        extend_box_idxs = np.where(extend_box_idxs >= 0, num_boxes - 1 - extend_box_idxs, extend_box_idxs)
 
         cls_labels = np.zeros(voxel_centers.shape[0], dtype=np.int32)
         reg_labels = np.zeros((voxel_centers.shape[0], 3), dtype=np.float32)
         bbox_reg_labels = np.zeros((voxel_centers.shape[0], 7), dtype=np.float32) if generate_bbox_reg_labels else None
 
-        for k in range(gt_boxes.shape[0]):
-            box_corners = gt_corners[k]
-            fg_pt_flag = box_utils.in_hull(voxel_centers, box_corners)
-            fg_voxels = voxel_centers[fg_pt_flag]
-            cls_labels[fg_pt_flag] = gt_classes[k]
-
-            # enlarge the bbox3d, ignore nearby points
-            extend_box_corners = extend_gt_corners[k]
-            fg_enlarge_flag = box_utils.in_hull(voxel_centers, extend_box_corners)
-            ignore_flag = np.logical_xor(fg_pt_flag, fg_enlarge_flag)
-            cls_labels[ignore_flag] = -1
-
-            # part offset labels
-            transformed_voxels = fg_voxels - gt_boxes[k, 0:3]
-            transformed_voxels = common_utils.rotate_pc_along_z(transformed_voxels, -gt_boxes[k, 6])
-            reg_labels[fg_pt_flag] = (transformed_voxels / gt_boxes[k, 3:6]) + np.array([0.5, 0.5, 0], dtype=np.float32)
-
-            if generate_bbox_reg_labels:
-                # rpn bbox regression target
-                center3d = gt_boxes[k, 0:3].copy()
-                center3d[2] += gt_boxes[k][5] / 2  # shift to center of 3D boxes
-                bbox_reg_labels[fg_pt_flag, 0:3] = center3d - fg_voxels
-                bbox_reg_labels[fg_pt_flag, 6] = gt_boxes[k, 6]  # dy
-
-                cur_mean_size = MEAN_SIZE[cfg.CLASS_NAMES[gt_classes[k] - 1]]
-                bbox_reg_labels[fg_pt_flag, 3:6] = (gt_boxes[k, 3:6] - np.array(cur_mean_size)) / cur_mean_size
+        fg_pt_flag = box_idxs >= 0
+        fg_voxels = voxel_centers[fg_pt_flag]
+        fg_gt_boxes = gt_boxes[box_idxs[fg_pt_flag]]
+        fg_gt_classes = gt_classes[box_idxs[fg_pt_flag]]
+        cls_labels[fg_pt_flag] = fg_gt_classes
+
+        # enlarge the bbox3d, ignore nearby points, also the foreground points of the earlier boxes
+        ignore_flag = extend_box_idxs > box_idxs
+        cls_labels[ignore_flag] = -1
+
+        # part offset labels
+        transformed_voxels = fg_voxels[:, 0:3] - fg_gt_boxes[:, 0:3]
+        cosa, sina = np.cos(-fg_gt_boxes[:, 6]), np.sin(-fg_gt_boxes[:, 6])
+        transformed_voxels[:, 0], transformed_voxels[:, 1] = \
+            transformed_voxels[:, 0] * cosa + transformed_voxels[:, 1] * sina, \
+            -transformed_voxels[:, 0] * sina + transformed_voxels[:, 1] * cosa
+        reg_labels[fg_pt_flag] = (transformed_voxels / fg_gt_boxes[:, 3:6]) + np.array([0.5, 0.5, 0], dtype=np.float32)
+
+        if generate_bbox_reg_labels:
+            # rpn bbox regression target
+            center3d = fg_gt_boxes[:, 0:3].copy()
+            center3d[:, 2] += fg_gt_boxes[:, 5] / 2  # shift to center of 3D boxes
+            bbox_reg_labels[fg_pt_flag, 0:3] = center3d - fg_voxels[:, 0:3]
+            bbox_reg_labels[fg_pt_flag, 6] = fg_gt_boxes[:, 6]  # dy
+
+            mean_size = np.array([MEAN_SIZE[cls_name] for cls_name in cfg.CLASS_NAMES], dtype=np.float32)
+            cur_mean_size = mean_size[fg_gt_classes - 1]
+            bbox_reg_labels[fg_pt_flag, 3:6] = (fg_gt_boxes[:, 3:6] - cur_mean_size) / cur_mean_size
 
         reg_labels = np.maximum(reg_labels, 0)
         return cls_labels, reg_labels, bbox_reg_labels
@@ -2,18 +2,23 @@ import os
 import sys
 import pickle
 import copy
+import hashlib
 import numpy as np
-from skimage import io
+from functools import partial
 from pathlib import Path
 import torch
-import spconv
 
-from pcdet.utils import box_utils, object3d_utils, calibration, common_utils
+from pcdet.utils import box_utils, object3d_utils, calibration, common_utils, point_store_utils, info_store_utils, \
+    sample_cache_utils, point_quant_utils, frame_cache_utils, image_utils
 from pcdet.ops.roiaware_pool3d import roiaware_pool3d_utils
 from pcdet.config import cfg
 from pcdet.datasets.data_augmentation.dbsampler import DataBaseSampler
+from pcdet.datasets.voxel_generator import build_voxel_generator
 from pcdet.datasets import DatasetTemplate
 
+# increased when the content of the infos changes, the infos of the other versions are not reused by --incremental
+KITTI_INFO_VERSION = 2
+
 
 class BaseKittiDataset(DatasetTemplate):
     def __init__(self, root_path, split='train'):
@@ -26,11 +31,57 @@ class BaseKittiDataset(DatasetTemplate):
             split_dir = os.path.join(self.root_path, 'ImageSets', split + '.txt')
 
         self.sample_id_list = [x.strip() for x in open(split_dir).readlines()] if os.path.exists(split_dir) else None
+        self.lidar_store = None
+        self.fov_lidar_store = None
+        self.lidar_quant_resolution = None
+        self.frame_cache = None
 
     def set_split(self, split):
         self.__init__(self.root_path, split)
 
+    def include_packed_lidar(self):
+        packed_file = os.path.join(self.root_split_path, 'velodyne_packed.bin')
+        if os.path.exists(point_store_utils.get_index_path(packed_file)):
+            self.lidar_store = point_store_utils.PackedPointStore(packed_file)
+        return self.lidar_store is not None
+
+    def include_fov_lidar(self, point_cloud_range=None):
+        """
+        :param point_cloud_range: the velodyne_fov.bin is used only if it is cropped by the same range (or not cropped)
+        :return: bool, whether the FOV points are read from velodyne_fov.bin
+        """
+        fov_file = os.path.join(self.root_split_path, 'velodyne_fov.bin')
+        if not os.path.exists(point_store_utils.get_index_path(fov_file)):
+            return False
+        fov_lidar_store = point_store_utils.PackedPointStore(fov_file)
+        crop = fov_lidar_store.crop
+        if crop is None or not crop['fov_only']:
+            return False
+        if crop['point_cloud_range'] is not None and (point_cloud_range is None or not np.allclose(
+                crop['point_cloud_range'], point_cloud_range)):
+            return False
+        self.fov_lidar_store = fov_lidar_store
+        return True
+
+    def include_quantized_lidar(self):
+        quant_dir = os.path.join(self.root_split_path, 'velodyne_quant')
+        self.lidar_quant_resolution = point_quant_utils.get_quantized_resolution(quant_dir)
+        return self.lidar_quant_resolution is not None
+
     def get_lidar(self, idx):
+        if self.lidar_store is not None and idx in self.lidar_store:
+            return self.lidar_store[idx]  # read-only view of the packed velodyne blob
+
+        if self.frame_cache is not None:
+            return self.frame_cache.get('lidar_%s' % idx, self.read_lidar_file, idx)
+        return self.read_lidar_file(idx)
+
+    def read_lidar_file(self, idx):
+        if self.lidar_quant_resolution is not None:
+            lidar_file = os.path.join(self.root_split_path, 'velodyne_quant', '%s.bin' % idx)
+            assert os.path.exists(lidar_file)
+            return point_quant_utils.load_quantized_points(lidar_file, self.lidar_quant_resolution)
+
         lidar_file = os.path.join(self.root_split_path, 'velodyne', '%s.bin' % idx)
         assert os.path.exists(lidar_file)
         return np.fromfile(lidar_file, dtype=np.float32).reshape(-1, 4)
@@ -38,14 +89,36 @@ class BaseKittiDataset(DatasetTemplate):
     def get_image_shape(self, idx):
         img_file = os.path.join(self.root_split_path, 'image_2', '%s.png' % idx)
         assert os.path.exists(img_file)
-        return np.array(io.imread(img_file).shape[:2], dtype=np.int32)
+        return image_utils.get_image_shape(img_file)
+
+    def get_image_shapes(self, sample_id_list=None, num_workers=8):
+        """
+        :param sample_id_list: list of str, default all the frames of the split
+        :return: dict, sample_idx -> (2) int32 [H, W]
+        """
+        sample_id_list = sample_id_list if sample_id_list is not None else self.sample_id_list
+        img_files = [os.path.join(self.root_split_path, 'image_2', '%s.png' % idx) for idx in sample_id_list]
+        image_shapes = image_utils.get_image_shapes(img_files, num_workers=num_workers)
+        return {idx: image_shape for idx, image_shape in zip(sample_id_list, image_shapes)}
 
     def get_label(self, idx):
         label_file = os.path.join(self.root_split_path, 'label_2', '%s.txt' % idx)
         assert os.path.exists(label_file)
         return object3d_utils.get_objects_from_label(label_file)
 
-    def get_calib(self, idx):
+    def get_label_annos(self, idx):
+        label_file = os.path.join(self.root_split_path, 'label_2', '%s.txt' % idx)
+        assert os.path.exists(label_file)
+        return object3d_utils.get_annos_from_label(label_file)
+
+    def get_calib(self, idx, info=None):
+        """
+        :param idx: str
+        :param info: the info of the frame, its calib matrices are used instead of parsing the calib file
+        :return: calibration.Calibration
+        """
+        if info is not None and 'calib' in info:
+            return calibration.Calibration(calibration.get_calib_from_info(info['calib']))
         calib_file = os.path.join(self.root_split_path, 'calib', '%s.txt' % idx)
         assert os.path.exists(calib_file)
         return calibration.Calibration(calib_file)
@@ -81,130 +154,266 @@ class BaseKittiDataset(DatasetTemplate):
 
         return pts_valid_flag
 
+    def process_single_scene(self, sample_idx, has_label=True, count_inside_pts=True, image_shapes=None):
+        """
+        :param image_shapes: optional, dict of sample_idx -> image shape prefetched by get_image_shapes
+        """
+        info = {}
+        pc_info = {'num_features': 4, 'lidar_idx': sample_idx}
+        info['point_cloud'] = pc_info
+
+        image_shape = image_shapes[sample_idx] if image_shapes is not None else self.get_image_shape(sample_idx)
+        image_info = {'image_idx': sample_idx, 'image_shape': image_shape}
+        info['image'] = image_info
+        calib = self.get_calib(sample_idx)
+
+        P2 = np.concatenate([calib.P2, np.array([[0., 0., 0., 1.]])], axis=0)
+        R0_4x4 = np.zeros([4, 4], dtype=calib.R0.dtype)
+        R0_4x4[3, 3] = 1.
+        R0_4x4[:3, :3] = calib.R0
+        V2C_4x4 = np.concatenate([calib.V2C, np.array([[0., 0., 0., 1.]])], axis=0)
+        calib_info = {'P2': P2, 'R0_rect': R0_4x4, 'Tr_velo_to_cam': V2C_4x4}
+
+        info['calib'] = calib_info
+
+        if has_label and os.path.isdir(os.path.join(self.root_split_path, 'planes')):
+            plane_file = os.path.join(self.root_split_path, 'planes', '%s.txt' % sample_idx)
+            info['road_plane'] = self.get_road_plane(sample_idx) if os.path.exists(plane_file) \
+                else np.full(4, np.nan)
+
+        if has_label:
+            label_annos = self.get_label_annos(sample_idx)
+            annotations = {}
+            annotations['name'] = label_annos['name']
+            annotations['truncated'] = label_annos['truncated']
+            annotations['occluded'] = label_annos['occluded']
+            annotations['alpha'] = label_annos['alpha']
+            annotations['bbox'] = label_annos['bbox'].astype(np.float32)
+            annotations['dimensions'] = label_annos['dimensions']  # lhw(camera) format
+            annotations['location'] = label_annos['location'].astype(np.float32)
+            annotations['rotation_y'] = label_annos['rotation_y']
+            annotations['score'] = label_annos.get('score', -np.ones(len(label_annos['name'])))
+            annotations['difficulty'] = label_annos['difficulty']
+
+            num_objects = int((annotations['name'] != 'DontCare').sum())
+            num_gt = len(annotations['name'])
+            index = list(range(num_objects)) + [-1] * (num_gt - num_objects)
+            annotations['index'] = np.array(index, dtype=np.int32)
+
+            loc = annotations['location'][:num_objects]
+            dims = annotations['dimensions'][:num_objects]
+            rots = annotations['rotation_y'][:num_objects]
+            loc_lidar = calib.rect_to_lidar(loc)
+            l, h, w = dims[:, 0:1], dims[:, 1:2], dims[:, 2:3]
+            gt_boxes_lidar = np.concatenate([loc_lidar, w, l, h, rots[..., np.newaxis]], axis=1)
+            annotations['gt_boxes_lidar'] = gt_boxes_lidar
+
+            info['annos'] = annotations
+
+            if count_inside_pts:
+                points = self.get_lidar(sample_idx)
+                pts_fov = points[calib.lidar_to_fov_idxs(points, info['image']['image_shape'])]
+                num_points_in_gt = -np.ones(num_gt, dtype=np.int32)
+
+                # the points inside overlapped boxes are counted for each box
+                num_points_in_gt[:num_objects] = box_utils.points_in_boxes_count(pts_fov[:, 0:3], gt_boxes_lidar)
+                annotations['num_points_in_gt'] = num_points_in_gt
+
+        return info
+
     def get_infos(self, num_workers=4, has_label=True, count_inside_pts=True, sample_id_list=None):
-        import concurrent.futures as futures
-
-        def process_single_scene(sample_idx):
-            print('%s sample_idx: %s' % (self.split, sample_idx))
-            info = {}
-            pc_info = {'num_features': 4, 'lidar_idx': sample_idx}
-            info['point_cloud'] = pc_info
-
-            image_info = {'image_idx': sample_idx, 'image_shape': self.get_image_shape(sample_idx)}
-            info['image'] = image_info
-            calib = self.get_calib(sample_idx)
-
-            P2 = np.concatenate([calib.P2, np.array([[0., 0., 0., 1.]])], axis=0)
-            R0_4x4 = np.zeros([4, 4], dtype=calib.R0.dtype)
-            R0_4x4[3, 3] = 1.
-            R0_4x4[:3, :3] = calib.R0
-            V2C_4x4 = np.concatenate([calib.V2C, np.array([[0., 0., 0., 1.]])], axis=0)
-            calib_info = {'P2': P2, 'R0_rect': R0_4x4, 'Tr_velo_to_cam': V2C_4x4}
-
-            info['calib'] = calib_info
-
-            if has_label:
-                obj_list = self.get_label(sample_idx)
-                annotations = {}
-                annotations['name'] = np.array([obj.cls_type for obj in obj_list])
-                annotations['truncated'] = np.array([obj.truncation for obj in obj_list])
-                annotations['occluded'] = np.array([obj.occlusion for obj in obj_list])
-                annotations['alpha'] = np.array([obj.alpha for obj in obj_list])
-                annotations['bbox'] = np.concatenate([obj.box2d.reshape(1, 4) for obj in obj_list], axis=0)
-                annotations['dimensions'] = np.array([[obj.l, obj.h, obj.w] for obj in obj_list])  # lhw(camera) format
-                annotations['location'] = np.concatenate([obj.loc.reshape(1, 3) for obj in obj_list], axis=0)
-                annotations['rotation_y'] = np.array([obj.ry for obj in obj_list])
-                annotations['score'] = np.array([obj.score for obj in obj_list])
-                annotations['difficulty'] = np.array([obj.level for obj in obj_list], np.int32)
-
-                num_objects = len([obj.cls_type for obj in obj_list if obj.cls_type != 'DontCare'])
-                num_gt = len(annotations['name'])
-                index = list(range(num_objects)) + [-1] * (num_gt - num_objects)
-                annotations['index'] = np.array(index, dtype=np.int32)
-
-                loc = annotations['location'][:num_objects]
-                dims = annotations['dimensions'][:num_objects]
-                rots = annotations['rotation_y'][:num_objects]
-                loc_lidar = calib.rect_to_lidar(loc)
-                l, h, w = dims[:, 0:1], dims[:, 1:2], dims[:, 2:3]
-                gt_boxes_lidar = np.concatenate([loc_lidar, w, l, h, rots[..., np.newaxis]], axis=1)
-                annotations['gt_boxes_lidar'] = gt_boxes_lidar
-
-                info['annos'] = annotations
-
-                if count_inside_pts:
-                    points = self.get_lidar(sample_idx)
-                    calib = self.get_calib(sample_idx)
-                    pts_rect = calib.lidar_to_rect(points[:, 0:3])
-
-                    fov_flag = self.get_fov_flag(pts_rect, info['image']['image_shape'], calib)
-                    pts_fov = points[fov_flag]
-                    corners_lidar = box_utils.boxes3d_to_corners3d_lidar(gt_boxes_lidar)
-                    num_points_in_gt = -np.ones(num_gt, dtype=np.int32)
-
-                    for k in range(num_objects):
-                        flag = box_utils.in_hull(pts_fov[:, 0:3], corners_lidar[k])
-                        num_points_in_gt[k] = flag.sum()
-                    annotations['num_points_in_gt'] = num_points_in_gt
-
-            return info
-
-        # temp = process_single_scene(self.sample_id_list[0])
         sample_id_list = sample_id_list if sample_id_list is not None else self.sample_id_list
-        with futures.ThreadPoolExecutor(num_workers) as executor:
-            infos = executor.map(process_single_scene, sample_id_list)
-        return list(infos)
+        # the image headers of the whole split are read by a thread pool before the frames are processed
+        image_shapes = self.get_image_shapes(sample_id_list)
+        process_func = partial(self.process_single_scene, has_label=has_label, count_inside_pts=count_inside_pts,
+                               image_shapes=image_shapes)
+        infos = common_utils.process_pool_map(process_func, sample_id_list, num_workers=num_workers,
+                                              desc='%s infos' % self.split)
+        return infos
+
+    def get_frame_signature(self, idx):
+        """
+        :param idx: str
+        :return: str, changes when the label, calib, image or velodyne file of the frame changes, the small text
+            files are hashed and the large files are identified by their size and modification time
+        """
+        md5 = hashlib.md5()
+        for sub_dir, suffix, hash_content in [('label_2', 'txt', True), ('calib', 'txt', True), ('planes', 'txt', True),
+                                              ('image_2', 'png', False), ('velodyne', 'bin', False)]:
+            file_path = os.path.join(self.root_split_path, sub_dir, '%s.%s' % (idx, suffix))
+            if not os.path.exists(file_path):
+                md5.update(b'missing')
+            elif hash_content:
+                with open(file_path, 'rb') as f:
+                    md5.update(f.read())
+            else:
+                stat = os.stat(file_path)
+                md5.update(('%d %d' % (stat.st_size, stat.st_mtime_ns)).encode())
+        return md5.hexdigest()
 
-    def create_groundtruth_database(self, info_path=None, used_classes=None, split='train'):
-        database_save_path = Path(self.root_path) / ('gt_database' if split == 'train' else ('gt_database_%s' % split))
+    def get_infos_incremental(self, old_infos=(), old_signatures=None, num_workers=4, has_label=True,
+                              count_inside_pts=True):
+        """
+        only the new frames and the frames whose signature changed are processed, the others reuse old_infos
+        :param old_infos: infos of the previous run, the frames not in self.sample_id_list any more are dropped
+        :param old_signatures: dict, sample_idx -> signature of the previous run
+        :return:
+            infos: list, in the order of self.sample_id_list
+            signatures: dict, sample_idx -> signature
+            reused_ids: set of the frames reused from old_infos
+        """
+        old_signatures = old_signatures if old_signatures is not None else {}
+        old_info_dict = {info['point_cloud']['lidar_idx']: info for info in old_infos}
+        signatures = {idx: self.get_frame_signature(idx) for idx in self.sample_id_list}
+        reused_ids = set([idx for idx in self.sample_id_list
+                          if idx in old_info_dict and old_signatures.get(idx, None) == signatures[idx]])
+
+        process_id_list = [idx for idx in self.sample_id_list if idx not in reused_ids]
+        new_infos = self.get_infos(num_workers=num_workers, has_label=has_label, count_inside_pts=count_inside_pts,
+                                   sample_id_list=process_id_list)
+        new_info_dict = dict(zip(process_id_list, new_infos))
+        infos = [old_info_dict[idx] if idx in reused_ids else new_info_dict[idx] for idx in self.sample_id_list]
+        print('%s infos: %d frames reused, %d frames processed, %d frames removed' % (
+            self.split, len(reused_ids), len(process_id_list), len(set(old_info_dict.keys()) - set(signatures.keys()))
+        ))
+        return infos, signatures, reused_ids
+
+    def process_single_gt_database(self, info, used_classes=None):
+        """
+        crop the points of each gt box of one frame
+        :return:
+            db_infos: list of dict, in the order of the gt boxes
+            gt_points_list: list of (N, 4) points of each db_info, relative to the box center
+        """
+        sample_idx = info['point_cloud']['lidar_idx']
+        points = self.get_lidar(sample_idx)
+        annos = info['annos']
+        names = annos['name']
+        difficulty = annos['difficulty']
+        bbox = annos['bbox']
+        gt_boxes = annos['gt_boxes_lidar']
+
+        num_obj = gt_boxes.shape[0]
+        box_offsets, pts_idxs = roiaware_pool3d_utils.points_in_boxes_csr_cpu(
+            torch.from_numpy(points[:, 0:3]), torch.from_numpy(gt_boxes)
+        )
+        box_offsets, pts_idxs = box_offsets.numpy(), pts_idxs.numpy()
+
+        db_infos, gt_points_list = [], []
+        for i in range(num_obj):
+            if (used_classes is None) or names[i] in used_classes:
+                gt_points = points[pts_idxs[box_offsets[i]:box_offsets[i + 1]]]
+                gt_points[:, :3] -= gt_boxes[i, :3]
+
+                db_info = {'name': names[i], 'image_idx': sample_idx, 'gt_idx': i,
+                           'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0],
+                           'difficulty': difficulty[i], 'bbox': bbox[i], 'score': annos['score'][i]}
+                db_infos.append(db_info)
+                gt_points_list.append(gt_points)
+        return db_infos, gt_points_list
+
+    def create_groundtruth_database(self, info_path=None, used_classes=None, split='train', num_workers=4,
+                                    reused_ids=None):
+        """
+        All the gt points are packed into one float32 blob, the points of each db_info are the rows
+        [point_offset, point_offset + num_points_in_gt) of the blob saved in db_info['path']
+        :param reused_ids: set of unchanged frames, their db_infos and gt points are copied from the existing
+            database instead of being cropped again, the frames not in info_path any more are dropped
+        """
+        db_data_save_path = Path(self.root_path) / ('kitti_gt_database_%s.bin' % split)
         db_info_save_path = Path(self.root_path) / ('kitti_dbinfos_%s.pkl' % split)
+        db_path = str(db_data_save_path.relative_to(self.root_path))
 
-        database_save_path.mkdir(parents=True, exist_ok=True)
         all_db_infos = {}
 
         with open(info_path, 'rb') as f:
             infos = pickle.load(f)
 
-        for k in range(len(infos)):
-            print('gt_database sample: %d/%d' % (k + 1, len(infos)))
-            info = infos[k]
-            sample_idx = info['point_cloud']['lidar_idx']
-            points = self.get_lidar(sample_idx)
-            annos = info['annos']
-            names = annos['name']
-            difficulty = annos['difficulty']
-            bbox = annos['bbox']
-            gt_boxes = annos['gt_boxes_lidar']
-
-            num_obj = gt_boxes.shape[0]
-            point_indices = roiaware_pool3d_utils.points_in_boxes_cpu(
-                torch.from_numpy(points[:, 0:3]), torch.from_numpy(gt_boxes)
-            ).numpy()  # (nboxes, npoints)
-
-            for i in range(num_obj):
-                filename = '%s_%s_%d.bin' % (sample_idx, names[i], i)
-                filepath = database_save_path / filename
-                gt_points = points[point_indices[i] > 0]
-
-                gt_points[:, :3] -= gt_boxes[i, :3]
-                with open(filepath, 'w') as f:
-                    gt_points.tofile(f)
-
-                if (used_classes is None) or names[i] in used_classes:
-                    db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
-                    db_info = {'name': names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
-                               'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0],
-                               'difficulty': difficulty[i], 'bbox': bbox[i], 'score': annos['score'][i]}
-                    if names[i] in all_db_infos:
-                        all_db_infos[names[i]].append(db_info)
+        old_frame_db_infos, old_db_data = {}, None
+        if reused_ids and db_info_save_path.exists() and db_data_save_path.exists() and \
+                os.path.getsize(db_data_save_path) > 0:
+            with open(db_info_save_path, 'rb') as f:
+                old_all_db_infos = pickle.load(f)
+            for db_infos in old_all_db_infos.values():
+                for db_info in db_infos:
+                    if db_info['image_idx'] in reused_ids and 'point_offset' in db_info:
+                        old_frame_db_infos.setdefault(db_info['image_idx'], []).append(db_info)
+            for db_infos in old_frame_db_infos.values():
+                db_infos.sort(key=lambda x: x['gt_idx'])
+            old_db_data = np.memmap(db_data_save_path, dtype=np.float32, mode='r').reshape([-1, 4])
+
+        process_infos = [info for info in infos if info['point_cloud']['lidar_idx'] not in old_frame_db_infos]
+        process_func = partial(self.process_single_gt_database, used_classes=used_classes)
+        process_results = common_utils.process_pool_map(process_func, process_infos, num_workers=num_workers,
+                                                        desc='gt_database')
+        process_results = {info['point_cloud']['lidar_idx']: ret for info, ret in zip(process_infos, process_results)}
+
+        def get_frame_results():
+            for info in infos:
+                sample_idx = info['point_cloud']['lidar_idx']
+                if sample_idx in process_results:
+                    yield process_results.pop(sample_idx)
+                else:
+                    db_infos = old_frame_db_infos[sample_idx]
+                    yield db_infos, [old_db_data[x['point_offset']:x['point_offset'] + x['num_points_in_gt']]
+                                     for x in db_infos]
+
+        # the old blob is still read by the reused frames, it is replaced at last
+        tmp_save_path = db_data_save_path.with_suffix('.bin.tmp')
+        point_offset = 0
+        with open(tmp_save_path, 'wb') as f:
+            for db_infos, gt_points_list in get_frame_results():
+                for db_info, gt_points in zip(db_infos, gt_points_list):
+                    gt_points.astype(np.float32).tofile(f)
+                    db_info['path'] = db_path
+                    db_info['point_offset'] = point_offset
+                    point_offset += gt_points.shape[0]
+
+                    if db_info['name'] in all_db_infos:
+                        all_db_infos[db_info['name']].append(db_info)
                     else:
-                        all_db_infos[names[i]] = [db_info]
+                        all_db_infos[db_info['name']] = [db_info]
+        del old_db_data
+        os.replace(tmp_save_path, db_data_save_path)
         for k, v in all_db_infos.items():
             print('Database %s: %d' % (k, len(v)))
 
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+    def create_packed_lidar(self, sample_id_list):
+        """pack the velodyne frames of the current root_split_path into one blob for memory-mapped reads"""
+        packed_file = os.path.join(self.root_split_path, 'velodyne_packed.bin')
+        self.lidar_store = None
+        point_store_utils.create_packed_point_store(packed_file, sample_id_list, self.get_lidar)
+        return packed_file
+
+    def create_fov_lidar(self, infos, point_cloud_range=None):
+        """
+        pack the camera FOV points of the frames (optionally also cropped by point_cloud_range) into one blob
+        :param infos: infos of the frames of the current root_split_path, their calib and image_shape are used
+        :param point_cloud_range: [x_min, y_min, z_min, x_max, y_max, z_max], None for no range cropping
+        """
+        fov_file = os.path.join(self.root_split_path, 'velodyne_fov.bin')
+        self.fov_lidar_store = None
+        info_dict = {info['point_cloud']['lidar_idx']: info for info in infos}
+
+        def get_fov_lidar(sample_idx):
+            info = info_dict[sample_idx]
+            points = self.get_lidar(sample_idx)
+            calib = self.get_calib(sample_idx, info=info)
+            points = points[calib.lidar_to_fov_idxs(points, info['image']['image_shape'])]
+            if point_cloud_range is not None:
+                points = common_utils.mask_points_by_range(points, point_cloud_range)
+            return points
+
+        crop = {
+            'fov_only': True,
+            'point_cloud_range': None if point_cloud_range is None else [float(x) for x in point_cloud_range]
+        }
+        point_store_utils.create_packed_point_store(fov_file, list(info_dict.keys()), get_fov_lidar, crop=crop)
+        return fov_file
+
     @staticmethod
     def generate_prediction_dict(input_dict, index, record_dict):
         # finally generate predictions.
@@ -353,6 +562,34 @@ class KittiDataset(BaseKittiDataset):
 
         self.mode = 'TRAIN' if self.training else 'TEST'
 
+        if cfg.DATA_CONFIG.get('USE_PACKED_LIDAR', False):
+            assert self.include_packed_lidar(), 'Please generate velodyne_packed.bin by create_kitti_infos'
+        frame_cache_mb = cfg.DATA_CONFIG.get('FRAME_CACHE_MB', 0)
+        if self.training and frame_cache_mb > 0:
+            # FRAME_CACHE_MB is the budget of the node, split between the training processes of the node
+            num_local_procs = 1
+            if torch.distributed.is_available() and torch.distributed.is_initialized():
+                num_local_procs = min(torch.distributed.get_world_size(), max(torch.cuda.device_count(), 1))
+            self.frame_cache = frame_cache_utils.SharedLRUCache(max_bytes=frame_cache_mb * 2 ** 20 // num_local_procs)
+        if cfg.DATA_CONFIG.get('USE_QUANTIZED_LIDAR', False):
+            assert self.include_quantized_lidar(), 'Please convert the velodyne files by create_kitti_quantized_points'
+        if cfg.DATA_CONFIG.FOV_POINTS_ONLY:
+            # points out of range are kept for training, the global augmentations may move them into the range
+            range_cropped = not self.training and cfg.DATA_CONFIG.MASK_POINTS_BY_RANGE
+            self.include_fov_lidar(cfg.DATA_CONFIG.POINT_CLOUD_RANGE if range_cropped else None)
+
+        self.sample_cache = None
+        sample_cache_dir = cfg.DATA_CONFIG[self.mode].get('SAMPLE_CACHE_DIR', None)
+        if not self.training and sample_cache_dir is not None:
+            assert not cfg.DATA_CONFIG[self.mode].SHUFFLE_POINTS, 'Only deterministic samples can be cached'
+            # the samples are stale after the infos (and the frames) are regenerated by create_kitti_infos
+            info_files = [cfg.ROOT_DIR / info_path for info_path in cfg.DATA_CONFIG[self.mode].INFO_PATH]
+            info_signatures = [(str(x), os.stat(x).st_size, os.stat(x).st_mtime_ns) for x in info_files]
+            config_hash = sample_cache_utils.get_config_hash(
+                cfg.DATA_CONFIG, cfg.CLASS_NAMES, cfg.MODEL.RPN.BACKBONE.get('TARGET_CONFIG', None), info_signatures
+            )
+            self.sample_cache = sample_cache_utils.SampleCache(cfg.ROOT_DIR / sample_cache_dir, config_hash)
+
         self.kitti_infos = []
         self.include_kitti_data(self.mode, logger)
         # self.kitti_infos = self.kitti_infos[:100]
@@ -363,13 +600,20 @@ class KittiDataset(BaseKittiDataset):
             logger.info('Loading KITTI dataset')
         kitti_infos = []
 
-        for info_path in cfg.DATA_CONFIG[mode].INFO_PATH:
-            info_path = cfg.ROOT_DIR / info_path
-            with open(info_path, 'rb') as f:
-                infos = pickle.load(f)
-                kitti_infos.extend(infos)
+        if cfg.DATA_CONFIG.get('USE_INFO_STORE', False):
+            # memory-mapped columns shared by all the DataLoader workers instead of a list of dicts
+            store_paths = [info_store_utils.get_store_path(cfg.ROOT_DIR / info_path)
+                           for info_path in cfg.DATA_CONFIG[mode].INFO_PATH]
+            kitti_infos = info_store_utils.InfoStore(store_paths)
+            self.kitti_infos = kitti_infos
+        else:
+            for info_path in cfg.DATA_CONFIG[mode].INFO_PATH:
+                info_path = cfg.ROOT_DIR / info_path
+                with open(info_path, 'rb') as f:
+                    infos = pickle.load(f)
+                    kitti_infos.extend(infos)
 
-        self.kitti_infos.extend(kitti_infos)
+            self.kitti_infos.extend(kitti_infos)
 
         if cfg.LOCAL_RANK == 0 and logger is not None:
             logger.info('Total samples for KITTI dataset: %d' % (len(kitti_infos)))
@@ -378,65 +622,53 @@ class KittiDataset(BaseKittiDataset):
         self.db_sampler = None
         db_sampler_cfg = cfg.DATA_CONFIG.AUGMENTATION.DB_SAMPLER
         if self.training and db_sampler_cfg.ENABLED:
-            db_infos = []
-            for db_info_path in db_sampler_cfg.DB_INFO_PATH:
-                db_info_path = cfg.ROOT_DIR / db_info_path
-                with open(str(db_info_path), 'rb') as f:
-                    infos = pickle.load(f)
-                    if db_infos.__len__() == 0:
-                        db_infos = infos
-                    else:
-                        [db_infos[cls].extend(infos[cls]) for cls in db_infos.keys()]
-
+            # filtered once and cached as structured arrays
+            db_infos = DataBaseSampler.load_db_infos(
+                [cfg.ROOT_DIR / x for x in db_sampler_cfg.DB_INFO_PATH], db_sampler_cfg.PREPARE, logger=logger
+            )
             self.db_sampler = DataBaseSampler(
                 db_infos=db_infos, sampler_cfg=db_sampler_cfg, class_names=class_names, logger=logger
             )
 
         voxel_generator_cfg = cfg.DATA_CONFIG.VOXEL_GENERATOR
-
-        # Support spconv 1.0 and 1.1
-        points = np.zeros((1, 3))
-        try:
-            self.voxel_generator = spconv.utils.VoxelGenerator(
-                voxel_size=voxel_generator_cfg.VOXEL_SIZE,
-                point_cloud_range=cfg.DATA_CONFIG.POINT_CLOUD_RANGE,
-                max_num_points=voxel_generator_cfg.MAX_POINTS_PER_VOXEL,
-                max_voxels=cfg.DATA_CONFIG[self.mode].MAX_NUMBER_OF_VOXELS
-            )
-            voxels, coordinates, num_points = self.voxel_generator.generate(points)
-        except:
-            self.voxel_generator = spconv.utils.VoxelGeneratorV2(
-                voxel_size=voxel_generator_cfg.VOXEL_SIZE,
-                point_cloud_range=cfg.DATA_CONFIG.POINT_CLOUD_RANGE,
-                max_num_points=voxel_generator_cfg.MAX_POINTS_PER_VOXEL,
-                max_voxels=cfg.DATA_CONFIG[self.mode].MAX_NUMBER_OF_VOXELS
-            )
-            voxel_grid = self.voxel_generator.generate(points)
-
+        self.voxel_generator = build_voxel_generator(
+            voxel_generator_cfg, point_cloud_range=cfg.DATA_CONFIG.POINT_CLOUD_RANGE,
+            max_voxels=cfg.DATA_CONFIG[self.mode].MAX_NUMBER_OF_VOXELS
+        )
 
     def __len__(self):
         return len(self.kitti_infos)
 
     def __getitem__(self, index):
         # index = 4
-        info = copy.deepcopy(self.kitti_infos[index])
+        info = self.kitti_infos[index]  # read only, the annos are copied by drop_info_with_name
 
         sample_idx = info['point_cloud']['lidar_idx']
+        calib = self.get_calib(sample_idx, info=info)
+        img_shape = info['image']['image_shape']
 
-        points = self.get_lidar(sample_idx)
-        calib = self.get_calib(sample_idx)
+        if self.sample_cache is not None:
+            example = self.sample_cache.load(sample_idx)
+            if example is not None:
+                example.update({'calib': calib, 'sample_idx': sample_idx, 'image_shape': img_shape})
+                return example
 
-        img_shape = info['image']['image_shape']
-        if cfg.DATA_CONFIG.FOV_POINTS_ONLY:
-            pts_rect = calib.lidar_to_rect(points[:, 0:3])
-            fov_flag = self.get_fov_flag(pts_rect, img_shape, calib)
-            points = points[fov_flag]
+        if cfg.DATA_CONFIG.FOV_POINTS_ONLY and self.fov_lidar_store is not None and sample_idx in self.fov_lidar_store:
+            points = self.fov_lidar_store[sample_idx]  # cropped by create_fov_lidar
+        else:
+            points = self.get_lidar(sample_idx)
+            if cfg.DATA_CONFIG.FOV_POINTS_ONLY:
+                points = points[calib.lidar_to_fov_idxs(points, img_shape)]
+        if not points.flags.writeable:
+            points = np.array(points)  # the augmentations modify the points in place
 
         input_dict = {
             'points': points,
             'sample_idx': sample_idx,
             'calib': calib,
         }
+        if 'road_plane' in info and not np.isnan(info['road_plane']).any():
+            input_dict['road_plane'] = info['road_plane']  # parsed by process_single_scene
 
         if 'annos' in info:
             annos = info['annos']
@@ -458,6 +690,8 @@ class KittiDataset(BaseKittiDataset):
             })
 
         example = self.prepare_data(input_dict=input_dict, has_label='annos' in info)
+        if self.sample_cache is not None:
+            self.sample_cache.save(sample_idx, example)
 
         example['sample_idx'] = sample_idx
         example['image_shape'] = img_shape
@@ -465,7 +699,14 @@ class KittiDataset(BaseKittiDataset):
         return example
 
 
-def create_kitti_infos(data_path, save_path, workers=4):
+def create_kitti_infos(data_path, save_path, workers=4, create_fov_points=False, fov_point_cloud_range=None,
+                       incremental=False):
+    """
+    :param create_fov_points: also pack the camera FOV points into velodyne_fov.bin for FOV_POINTS_ONLY
+    :param fov_point_cloud_range: optional, crop the packed FOV points by this range, implies create_fov_points
+    :param incremental: only process the new and changed frames according to the signatures saved in
+        kitti_infos_manifest.pkl by the previous run, the removed frames are dropped
+    """
     dataset = BaseKittiDataset(root_path=data_path)
     train_split, val_split = 'train', 'val'
 
@@ -473,44 +714,135 @@ def create_kitti_infos(data_path, save_path, workers=4):
     val_filename = save_path / ('kitti_infos_%s.pkl' % val_split)
     trainval_filename = save_path / 'kitti_infos_trainval.pkl'
     test_filename = save_path / 'kitti_infos_test.pkl'
+    manifest_filename = save_path / 'kitti_infos_manifest.pkl'
+
+    old_manifest, manifest, reused_ids = {}, {'info_version': KITTI_INFO_VERSION}, {}
+    if incremental and manifest_filename.exists():
+        with open(manifest_filename, 'rb') as f:
+            old_manifest = pickle.load(f)
+        if old_manifest.get('info_version', None) != KITTI_INFO_VERSION:
+            print('The infos are generated by another version of the code, all the frames are processed again')
+            old_manifest = {}
+
+    def get_split_infos(split, info_filename, has_label, count_inside_pts):
+        dataset.set_split(split)
+        old_infos = []
+        if split in old_manifest and info_filename.exists():
+            with open(info_filename, 'rb') as f:
+                old_infos = pickle.load(f)
+        infos, manifest[split], reused_ids[split] = dataset.get_infos_incremental(
+            old_infos, old_manifest.get(split, None), num_workers=workers, has_label=has_label,
+            count_inside_pts=count_inside_pts
+        )
+        return infos
+
+    def is_unchanged(splits, data_file):
+        # no frame is added, changed or removed, and the packed file exists
+        return all([len(reused_ids[x]) == len(manifest[x]) == len(old_manifest.get(x, {})) for x in splits]) and \
+            os.path.exists(point_store_utils.get_index_path(data_file))
+
+    fov_crop_range = None if fov_point_cloud_range is None else [float(x) for x in fov_point_cloud_range]
 
     print('---------------Start to generate data infos---------------')
 
-    dataset.set_split(train_split)
-    kitti_infos_train = dataset.get_infos(num_workers=workers, has_label=True, count_inside_pts=True)
+    kitti_infos_train = get_split_infos(train_split, train_filename, has_label=True, count_inside_pts=True)
     with open(train_filename, 'wb') as f:
         pickle.dump(kitti_infos_train, f)
+    info_store_utils.create_info_store(info_store_utils.get_store_path(train_filename), kitti_infos_train)
     print('Kitti info train file is saved to %s' % train_filename)
 
-    dataset.set_split(val_split)
-    kitti_infos_val = dataset.get_infos(num_workers=workers, has_label=True, count_inside_pts=True)
+    kitti_infos_val = get_split_infos(val_split, val_filename, has_label=True, count_inside_pts=True)
     with open(val_filename, 'wb') as f:
         pickle.dump(kitti_infos_val, f)
+    info_store_utils.create_info_store(info_store_utils.get_store_path(val_filename), kitti_infos_val)
     print('Kitti info val file is saved to %s' % val_filename)
 
     with open(trainval_filename, 'wb') as f:
         pickle.dump(kitti_infos_train + kitti_infos_val, f)
+    info_store_utils.create_info_store(info_store_utils.get_store_path(trainval_filename),
+                                       kitti_infos_train + kitti_infos_val)
     print('Kitti info trainval file is saved to %s' % trainval_filename)
 
-    dataset.set_split('test')
-    kitti_infos_test = dataset.get_infos(num_workers=workers, has_label=False, count_inside_pts=False)
+    kitti_infos_test = get_split_infos('test', test_filename, has_label=False, count_inside_pts=False)
     with open(test_filename, 'wb') as f:
         pickle.dump(kitti_infos_test, f)
+    info_store_utils.create_info_store(info_store_utils.get_store_path(test_filename), kitti_infos_test)
     print('Kitti info test file is saved to %s' % test_filename)
 
     print('---------------Start create groundtruth database for data augmentation---------------')
     dataset.set_split(train_split)
-    dataset.create_groundtruth_database(train_filename, split=train_split)
+    dataset.create_groundtruth_database(train_filename, split=train_split, num_workers=workers,
+                                        reused_ids=reused_ids[train_split])
 
+    print('---------------Start to pack the velodyne frames---------------')
+    training_id_list = [info['point_cloud']['lidar_idx'] for info in kitti_infos_train + kitti_infos_val]
+    dataset.set_split(train_split)
+    packed_file = os.path.join(dataset.root_split_path, 'velodyne_packed.bin')
+    if not is_unchanged([train_split, val_split], packed_file):
+        packed_file = dataset.create_packed_lidar(training_id_list)
+    print('Packed velodyne file of the training frames is saved to %s' % packed_file)
+    dataset.set_split('test')
+    packed_file = os.path.join(dataset.root_split_path, 'velodyne_packed.bin')
+    if not is_unchanged(['test'], packed_file):
+        packed_file = dataset.create_packed_lidar(dataset.sample_id_list)
+    print('Packed velodyne file of the testing frames is saved to %s' % packed_file)
+
+    if create_fov_points or fov_point_cloud_range is not None:
+        print('---------------Start to pack the FOV points---------------')
+        dataset.set_split(train_split)
+        fov_file = os.path.join(dataset.root_split_path, 'velodyne_fov.bin')
+        if not is_unchanged([train_split, val_split], fov_file) or \
+                point_store_utils.PackedPointStore(fov_file).crop['point_cloud_range'] != fov_crop_range:
+            fov_file = dataset.create_fov_lidar(kitti_infos_train + kitti_infos_val,
+                                                point_cloud_range=fov_point_cloud_range)
+        print('FOV points of the training frames are saved to %s' % fov_file)
+        dataset.set_split('test')
+        fov_file = os.path.join(dataset.root_split_path, 'velodyne_fov.bin')
+        if not is_unchanged(['test'], fov_file) or \
+                point_store_utils.PackedPointStore(fov_file).crop['point_cloud_range'] != fov_crop_range:
+            fov_file = dataset.create_fov_lidar(kitti_infos_test, point_cloud_range=fov_point_cloud_range)
+        print('FOV points of the testing frames are saved to %s' % fov_file)
+
+    # saved at last, so that an interrupted run is redone by the next run
+    with open(manifest_filename, 'wb') as f:
+        pickle.dump(manifest, f)
     print('---------------Data preparation Done---------------')
 
 
+def create_kitti_quantized_points(data_path, resolution=0.01, workers=4):
+    """
+    convert velodyne/ of both splits into velodyne_quant/ and the gt database into gt_database_quant/
+    :param data_path: KITTI data path
+    :param resolution: float, quantization step of x, y, z in meters, should be well below the voxel size
+    """
+    data_path = Path(data_path)
+    for split_dir in ['training', 'testing']:
+        lidar_files = sorted((data_path / split_dir / 'velodyne').glob('*.bin'))
+        max_error = point_quant_utils.convert_to_quantized(
+            lidar_files, data_path / split_dir / 'velodyne_quant', resolution=resolution, num_workers=workers
+        )
+        print('Quantized %d velodyne files of %s, max error: xyz %.4fm, intensity %.4f' %
+              (len(lidar_files), split_dir, max_error[0], max_error[1]))
+
+    db_files = sorted((data_path / 'gt_database').glob('*.bin')) + sorted(data_path.glob('kitti_gt_database_*.bin'))
+    max_error = point_quant_utils.convert_to_quantized(
+        db_files, data_path / 'gt_database_quant', resolution=resolution, num_workers=workers
+    )
+    print('Quantized %d gt database files, max error: xyz %.4fm, intensity %.4f' %
+          (len(db_files), max_error[0], max_error[1]))
+
+
 if __name__ == '__main__':
     if sys.argv.__len__() > 1 and sys.argv[1] == 'create_kitti_infos':
         create_kitti_infos(
             data_path=cfg.ROOT_DIR / 'data' / 'kitti',
-            save_path=cfg.ROOT_DIR / 'data' / 'kitti'
+            save_path=cfg.ROOT_DIR / 'data' / 'kitti',
+            create_fov_points='--fov' in sys.argv,
+            fov_point_cloud_range=cfg.DATA_CONFIG.POINT_CLOUD_RANGE if '--fov_crop' in sys.argv else None,
+            incremental='--incremental' in sys.argv
         )
+    elif sys.argv.__len__() > 1 and sys.argv[1] == 'create_kitti_quantized_points':
+        create_kitti_quantized_points(data_path=cfg.ROOT_DIR / 'data' / 'kitti')
     else:
         A = KittiDataset(root_path='data/kitti', class_names=cfg.CLASS_NAMES, split='train', training=True)
         import pdb
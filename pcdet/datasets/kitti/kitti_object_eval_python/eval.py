@@ -1,7 +1,13 @@
 import numpy as np
 import numba
 import io as sysio
-from .rotate_iou import rotate_iou_gpu_eval
+from numba import cuda
+from .rotate_iou_cpu import rotate_iou_cpu_eval
+if cuda.is_available():
+    from .rotate_iou import rotate_iou_gpu_eval as rotate_iou_eval
+else:
+    # eval machines without gpu fall back to the multi-core numba version
+    rotate_iou_eval = rotate_iou_cpu_eval
 
 
 @numba.jit
@@ -112,7 +118,7 @@ def image_box_overlap(boxes, query_boxes, criterion=-1):
 
 
 def bev_box_overlap(boxes, qboxes, criterion=-1):
-    riou = rotate_iou_gpu_eval(boxes, qboxes, criterion)
+    riou = rotate_iou_eval(boxes, qboxes, criterion)
     return riou
 
 
@@ -146,8 +152,8 @@ def d3_box_overlap_kernel(boxes, qboxes, rinc, criterion=-1):
 
 
 def d3_box_overlap(boxes, qboxes, criterion=-1):
-    rinc = rotate_iou_gpu_eval(boxes[:, [0, 2, 3, 5, 6]],
-                               qboxes[:, [0, 2, 3, 5, 6]], 2)
+    rinc = rotate_iou_eval(boxes[:, [0, 2, 3, 5, 6]],
+                           qboxes[:, [0, 2, 3, 5, 6]], 2)
     d3_box_overlap_kernel(boxes, qboxes, rinc, criterion)
     return rinc
 
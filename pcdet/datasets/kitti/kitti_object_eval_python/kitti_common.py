@@ -5,7 +5,8 @@ import re
 from collections import OrderedDict
 
 import numpy as np
-from skimage import io
+
+from ....utils import object3d_utils
 
 def get_image_index_str(img_idx):
     return "{:06d}".format(img_idx)
@@ -84,6 +85,7 @@ def get_kitti_image_info(path,
             img_path = image_info['img_path']
             if relative_path:
                 img_path = str(root_path / img_path)
+            from skimage import io
             image_info['img_shape'] = np.array(
                 io.imread(img_path).shape[:2], dtype=np.int32)
         if label_info:
@@ -290,44 +292,28 @@ def add_difficulty_to_annos(info):
     return diff
 
 
-def get_label_anno(label_path):
-    annotations = {}
-    annotations.update({
-        'name': [],
-        'truncated': [],
-        'occluded': [],
-        'alpha': [],
-        'bbox': [],
-        'dimensions': [],
-        'location': [],
-        'rotation_y': []
-    })
-    with open(label_path, 'r') as f:
-        lines = f.readlines()
-    # if len(lines) == 0 or len(lines[0]) < 15:
-    #     content = []
-    # else:
-    content = [line.strip().split(' ') for line in lines]
-    annotations['name'] = np.array([x[0] for x in content])
-    annotations['truncated'] = np.array([float(x[1]) for x in content])
-    annotations['occluded'] = np.array([int(x[2]) for x in content])
-    annotations['alpha'] = np.array([float(x[3]) for x in content])
-    annotations['bbox'] = np.array(
-        [[float(info) for info in x[4:8]] for x in content]).reshape(-1, 4)
-    # dimensions will convert hwl format to standard lhw(camera) format.
-    annotations['dimensions'] = np.array(
-        [[float(info) for info in x[8:11]] for x in content]).reshape(
-            -1, 3)[:, [2, 0, 1]]
-    annotations['location'] = np.array(
-        [[float(info) for info in x[11:14]] for x in content]).reshape(-1, 3)
-    annotations['rotation_y'] = np.array(
-        [float(x[14]) for x in content]).reshape(-1)
-    if len(content) != 0 and len(content[0]) == 16:  # have score
-        annotations['score'] = np.array([float(x[15]) for x in content])
+def _to_eval_anno(label_annos):
+    annotations = {
+        'name': label_annos['name'],
+        'truncated': label_annos['truncated'],
+        'occluded': label_annos['occluded'].astype(np.int64),
+        'alpha': label_annos['alpha'],
+        'bbox': label_annos['bbox'],
+        # dimensions are already in the standard lhw(camera) format.
+        'dimensions': label_annos['dimensions'],
+        'location': label_annos['location'],
+        'rotation_y': label_annos['rotation_y'],
+    }
+    if 'score' in label_annos:  # have score
+        annotations['score'] = label_annos['score']
     else:
         annotations['score'] = np.zeros([len(annotations['bbox'])])
     return annotations
 
+
+def get_label_anno(label_path):
+    return _to_eval_anno(object3d_utils.get_annos_from_label(label_path))
+
 def get_label_annos(label_folder, image_ids=None):
     if image_ids is None:
         filepaths = pathlib.Path(label_folder).glob('*.txt')
@@ -337,12 +323,9 @@ def get_label_annos(label_folder, image_ids=None):
         image_ids = sorted(image_ids)
     if not isinstance(image_ids, list):
         image_ids = list(range(image_ids))
-    annos = []
     label_folder = pathlib.Path(label_folder)
-    for idx in image_ids:
-        image_idx = get_image_index_str(idx)
-        label_filename = label_folder / (image_idx + '.txt')
-        annos.append(get_label_anno(label_filename))
+    label_filenames = [label_folder / (get_image_index_str(idx) + '.txt') for idx in image_ids]
+    annos = [_to_eval_anno(x) for x in object3d_utils.get_annos_from_labels(label_filenames)]
     return annos
 
 def area(boxes, add1=False):
@@ -0,0 +1,252 @@
+#####################
+# CPU port of the numba.cuda kernels in rotate_iou.py, the device functions are translated one to one
+# (float32 buffers, same operation order, numpy error model so a degenerate pair gives nan/inf instead
+# of raising, like on the gpu) so that both backends give the same overlaps.
+#####################
+import math
+
+import numba
+import numpy as np
+
+
+@numba.njit(error_model='numpy')
+def trangle_area(a, b, c):
+    return ((a[0] - c[0]) * (b[1] - c[1]) - (a[1] - c[1]) *
+            (b[0] - c[0])) / 2.0
+
+
+@numba.njit(error_model='numpy')
+def area(int_pts, num_of_inter):
+    area_val = 0.0
+    for i in range(num_of_inter - 2):
+        area_val += abs(
+            trangle_area(int_pts[:2], int_pts[2 * i + 2:2 * i + 4],
+                         int_pts[2 * i + 4:2 * i + 6]))
+    return area_val
+
+
+@numba.njit(error_model='numpy')
+def sort_vertex_in_convex_polygon(int_pts, num_of_inter, vs):
+    if num_of_inter > 0:
+        center_x = np.float32(0.0)
+        center_y = np.float32(0.0)
+        for i in range(num_of_inter):
+            center_x += int_pts[2 * i]
+            center_y += int_pts[2 * i + 1]
+        center_x = np.float32(center_x / num_of_inter)
+        center_y = np.float32(center_y / num_of_inter)
+        for i in range(num_of_inter):
+            v0 = np.float32(int_pts[2 * i] - center_x)
+            v1 = np.float32(int_pts[2 * i + 1] - center_y)
+            d = math.sqrt(v0 * v0 + v1 * v1)
+            v0 = np.float32(v0 / d)
+            v1 = np.float32(v1 / d)
+            if v1 < 0:
+                v0 = np.float32(-2 - v0)
+            vs[i] = v0
+        for i in range(1, num_of_inter):
+            if vs[i - 1] > vs[i]:
+                temp = vs[i]
+                tx = int_pts[2 * i]
+                ty = int_pts[2 * i + 1]
+                j = i
+                while j > 0 and vs[j - 1] > temp:
+                    vs[j] = vs[j - 1]
+                    int_pts[j * 2] = int_pts[j * 2 - 2]
+                    int_pts[j * 2 + 1] = int_pts[j * 2 - 1]
+                    j -= 1
+
+                vs[j] = temp
+                int_pts[j * 2] = tx
+                int_pts[j * 2 + 1] = ty
+
+
+@numba.njit(error_model='numpy')
+def line_segment_intersection(pts1, pts2, i, j, temp_pts):
+    A0 = pts1[2 * i]
+    A1 = pts1[2 * i + 1]
+
+    B0 = pts1[2 * ((i + 1) % 4)]
+    B1 = pts1[2 * ((i + 1) % 4) + 1]
+
+    C0 = pts2[2 * j]
+    C1 = pts2[2 * j + 1]
+
+    D0 = pts2[2 * ((j + 1) % 4)]
+    D1 = pts2[2 * ((j + 1) % 4) + 1]
+    BA0 = B0 - A0
+    BA1 = B1 - A1
+    DA0 = D0 - A0
+    CA0 = C0 - A0
+    DA1 = D1 - A1
+    CA1 = C1 - A1
+    acd = DA1 * CA0 > CA1 * DA0
+    bcd = (D1 - B1) * (C0 - B0) > (C1 - B1) * (D0 - B0)
+    if acd != bcd:
+        abc = CA1 * BA0 > BA1 * CA0
+        abd = DA1 * BA0 > BA1 * DA0
+        if abc != abd:
+            DC0 = D0 - C0
+            DC1 = D1 - C1
+            ABBA = A0 * B1 - B0 * A1
+            CDDC = C0 * D1 - D0 * C1
+            DH = BA1 * DC0 - BA0 * DC1
+            Dx = ABBA * DC0 - BA0 * CDDC
+            Dy = ABBA * DC1 - BA1 * CDDC
+            temp_pts[0] = Dx / DH
+            temp_pts[1] = Dy / DH
+            return True
+    return False
+
+
+@numba.njit(error_model='numpy')
+def point_in_quadrilateral(pt_x, pt_y, corners):
+    ab0 = corners[2] - corners[0]
+    ab1 = corners[3] - corners[1]
+
+    ad0 = corners[6] - corners[0]
+    ad1 = corners[7] - corners[1]
+
+    ap0 = pt_x - corners[0]
+    ap1 = pt_y - corners[1]
+
+    abab = ab0 * ab0 + ab1 * ab1
+    abap = ab0 * ap0 + ab1 * ap1
+    adad = ad0 * ad0 + ad1 * ad1
+    adap = ad0 * ap0 + ad1 * ap1
+
+    return abab >= abap and abap >= 0 and adad >= adap and adap >= 0
+
+
+@numba.njit(error_model='numpy')
+def quadrilateral_intersection(pts1, pts2, int_pts, temp_pts):
+    num_of_inter = 0
+    for i in range(4):
+        if point_in_quadrilateral(pts1[2 * i], pts1[2 * i + 1], pts2):
+            int_pts[num_of_inter * 2] = pts1[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts1[2 * i + 1]
+            num_of_inter += 1
+        if point_in_quadrilateral(pts2[2 * i], pts2[2 * i + 1], pts1):
+            int_pts[num_of_inter * 2] = pts2[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts2[2 * i + 1]
+            num_of_inter += 1
+    for i in range(4):
+        for j in range(4):
+            has_pts = line_segment_intersection(pts1, pts2, i, j, temp_pts)
+            if has_pts:
+                int_pts[num_of_inter * 2] = temp_pts[0]
+                int_pts[num_of_inter * 2 + 1] = temp_pts[1]
+                num_of_inter += 1
+
+    return num_of_inter
+
+
+@numba.njit(error_model='numpy')
+def rbbox_to_corners(corners, rbbox):
+    # generate clockwise corners and rotate it clockwise
+    angle = rbbox[4]
+    a_cos = np.float32(math.cos(angle))
+    a_sin = np.float32(math.sin(angle))
+    center_x = rbbox[0]
+    center_y = rbbox[1]
+    x_d = rbbox[2]
+    y_d = rbbox[3]
+    corners_x = (-x_d / 2, -x_d / 2, x_d / 2, x_d / 2)
+    corners_y = (-y_d / 2, y_d / 2, y_d / 2, -y_d / 2)
+    for i in range(4):
+        cx = np.float32(corners_x[i])
+        cy = np.float32(corners_y[i])
+        corners[2 * i] = a_cos * cx + a_sin * cy + center_x
+        corners[2 * i + 1] = -a_sin * cx + a_cos * cy + center_y
+
+
+@numba.njit(error_model='numpy')
+def inter(rbbox1, rbbox2, buffer):
+    """
+    :param buffer: (50) float32 scratch memory, reused across calls of the same thread
+    """
+    corners1 = buffer[0:8]
+    corners2 = buffer[8:16]
+    intersection_corners = buffer[16:32]
+    temp_pts = buffer[32:34]
+    vs = buffer[34:50]
+
+    rbbox_to_corners(corners1, rbbox1)
+    rbbox_to_corners(corners2, rbbox2)
+
+    num_intersection = quadrilateral_intersection(corners1, corners2,
+                                                  intersection_corners, temp_pts)
+    sort_vertex_in_convex_polygon(intersection_corners, num_intersection, vs)
+
+    return area(intersection_corners, num_intersection)
+
+
+@numba.njit(error_model='numpy')
+def devRotateIoUEval(rbox1, rbox2, criterion, buffer):
+    area1 = rbox1[2] * rbox1[3]
+    area2 = rbox2[2] * rbox2[3]
+    area_inter = inter(rbox1, rbox2, buffer)
+    if criterion == -1:
+        return area_inter / (area1 + area2 - area_inter)
+    elif criterion == 0:
+        return area_inter / area1
+    elif criterion == 1:
+        return area_inter / area2
+    else:
+        return area_inter
+
+
+@numba.njit(parallel=True, error_model='numpy')
+def rotate_iou_kernel_eval(boxes, query_boxes, iou, criterion=-1):
+    N, K = boxes.shape[0], query_boxes.shape[0]
+    for i in numba.prange(N):
+        buffer = np.zeros(50, dtype=np.float32)
+        for j in range(K):
+            # same argument order as the cuda kernel: (query_box, box)
+            iou[i, j] = devRotateIoUEval(query_boxes[j], boxes[i], criterion, buffer)
+
+
+def rotate_iou_cpu_eval(boxes, query_boxes, criterion=-1):
+    """rotated box iou running on all cpu cores, drop-in replacement of rotate_iou_gpu_eval
+    for machines without cuda.
+
+    Args:
+        boxes (float tensor: [N, 5]): rbboxes. format: centers, dims,
+            angles(clockwise when positive)
+        query_boxes (float tensor: [K, 5]): [description]
+        criterion (int, optional): same as rotate_iou_gpu_eval, -1: iou, 2: intersection area
+
+    Returns:
+        iou (float32 tensor: [N, K])
+    """
+    boxes = np.ascontiguousarray(boxes, dtype=np.float32)
+    query_boxes = np.ascontiguousarray(query_boxes, dtype=np.float32)
+    N = boxes.shape[0]
+    K = query_boxes.shape[0]
+    iou = np.zeros((N, K), dtype=np.float32)
+    if N == 0 or K == 0:
+        return iou
+    rotate_iou_kernel_eval(boxes, query_boxes, iou, criterion)
+    return iou
+
+
+if __name__ == '__main__':
+    import time
+
+    # one val frame has ~ 10 gt boxes against ~ 100 detections, the whole split adds up to ~ 3769 such pairs
+    for N, K in [(100, 100), (500, 500), (2000, 2000)]:
+        boxes = np.random.rand(N, 5).astype(np.float32) * np.array([70, 80, 2, 5, 6.28], dtype=np.float32)
+        query_boxes = np.random.rand(K, 5).astype(np.float32) * np.array([70, 80, 2, 5, 6.28], dtype=np.float32)
+        boxes[:, 2:4] += 1
+        query_boxes[:, 2:4] += 1
+
+        rotate_iou_cpu_eval(boxes[:2], query_boxes[:2])  # jit compilation
+        t1 = time.time()
+        iou = rotate_iou_cpu_eval(boxes, query_boxes, -1)
+        print('N=%d, K=%d, cpu time: %.4fs (%d threads)' % (N, K, time.time() - t1, numba.get_num_threads()))
+
+        from numba import cuda
+        if cuda.is_available():
+            from .rotate_iou import rotate_iou_gpu_eval
+            iou_gpu = rotate_iou_gpu_eval(boxes, query_boxes, -1)
+            print('max abs diff to gpu: %.6f' % np.abs(iou - iou_gpu).max())
@@ -0,0 +1,185 @@
+import numba
+import numpy as np
+
+
+@numba.njit
+def _points_to_voxel_hash_kernel(points, voxel_size, coors_range, grid_size, max_points, max_voxels,
+                                 voxels, coors, num_points_per_voxel, table_keys, table_vals):
+    """
+    Same semantics as spconv.utils.points_to_voxel (reverse_index=True), the dense coor_to_voxelidx grid is
+    replaced by an open addressing hash table on the linear voxel index
+    """
+    num_features = points.shape[1]
+    table_mask = table_keys.shape[0] - 1
+    grid_yx = grid_size[1] * grid_size[0]
+    voxel_num = 0
+    coor = np.zeros(3, dtype=np.int32)
+    for i in range(points.shape[0]):
+        failed = False
+        for j in range(3):
+            c = np.floor((points[i, j] - coors_range[j]) / voxel_size[j])
+            if c < 0 or c >= grid_size[j]:
+                failed = True
+                break
+            coor[2 - j] = c
+        if failed:
+            continue
+
+        key = coor[0] * grid_yx + coor[1] * grid_size[0] + coor[2]
+        slot = (key * 2654435761) & table_mask
+        while table_keys[slot] != -1 and table_keys[slot] != key:
+            slot = (slot + 1) & table_mask
+
+        if table_keys[slot] == -1:
+            if voxel_num >= max_voxels:
+                continue
+            voxelidx = voxel_num
+            voxel_num += 1
+            table_keys[slot] = key
+            table_vals[slot] = voxelidx
+            coors[voxelidx] = coor
+        else:
+            voxelidx = table_vals[slot]
+
+        num = num_points_per_voxel[voxelidx]
+        if num < max_points:
+            for k in range(num_features):
+                voxels[voxelidx, num, k] = points[i, k]
+            num_points_per_voxel[voxelidx] += 1
+    return voxel_num
+
+
+class VoxelGenerator(object):
+    def __init__(self, voxel_size, point_cloud_range, max_num_points, max_voxels=20000):
+        """
+        Built-in replacement of spconv.utils.VoxelGenerator, the data workers do not need spconv
+        :param voxel_size: [vx, vy, vz]
+        :param point_cloud_range: [x_min, y_min, z_min, x_max, y_max, z_max]
+        :param max_num_points: max number of points in each voxel
+        :param max_voxels: int
+        """
+        point_cloud_range = np.array(point_cloud_range, dtype=np.float32)
+        voxel_size = np.array(voxel_size, dtype=np.float32)
+        grid_size = (point_cloud_range[3:] - point_cloud_range[:3]) / voxel_size
+        grid_size = np.round(grid_size).astype(np.int64)
+
+        self._voxel_size = voxel_size
+        self._point_cloud_range = point_cloud_range
+        self._max_num_points = max_num_points
+        self._max_voxels = max_voxels
+        self._grid_size = grid_size
+
+    def generate(self, points, max_voxels=None):
+        """
+        :param points: (N, C), the first 3 columns are [x, y, z]
+        :param max_voxels: overrides the max_voxels of the constructor
+        :return: dict
+            voxels: (num_voxels, max_num_points, C), the points of each voxel in input order, zero padded
+            coordinates: (num_voxels, 3) int32 [z_idx, y_idx, x_idx]
+            num_points_per_voxel: (num_voxels) int32
+            grid_size: (3) [nx, ny, nz]
+        """
+        max_voxels = self._max_voxels if max_voxels is None else max_voxels
+        num_points, num_features = points.shape
+
+        voxels = np.zeros((max_voxels, self._max_num_points, num_features), dtype=points.dtype)
+        coors = np.zeros((max_voxels, 3), dtype=np.int32)
+        num_points_per_voxel = np.zeros((max_voxels, ), dtype=np.int32)
+
+        # power-of-2 capacity with a load factor below 0.5
+        table_size = 1 << int(np.ceil(np.log2(max(2 * min(num_points, max_voxels), 2))))
+        table_keys = -np.ones(table_size, dtype=np.int64)
+        table_vals = np.zeros(table_size, dtype=np.int32)
+
+        voxel_num = _points_to_voxel_hash_kernel(
+            points, self._voxel_size, self._point_cloud_range, self._grid_size, self._max_num_points, max_voxels,
+            voxels, coors, num_points_per_voxel, table_keys, table_vals
+        )
+        return {
+            'voxels': voxels[:voxel_num],
+            'coordinates': coors[:voxel_num],
+            'num_points_per_voxel': num_points_per_voxel[:voxel_num],
+            'grid_size': self._grid_size
+        }
+
+    @property
+    def voxel_size(self):
+        return self._voxel_size
+
+    @property
+    def max_num_points_per_voxel(self):
+        return self._max_num_points
+
+    @property
+    def point_cloud_range(self):
+        return self._point_cloud_range
+
+    @property
+    def grid_size(self):
+        return self._grid_size
+
+
+def build_voxel_generator(voxel_generator_cfg, point_cloud_range, max_voxels):
+    """
+    :param voxel_generator_cfg: cfg.DATA_CONFIG.VOXEL_GENERATOR, NAME is 'spconv' (default) or 'numba'
+    :param point_cloud_range:
+    :param max_voxels:
+    :return:
+    """
+    name = voxel_generator_cfg.get('NAME', 'spconv')
+    if name == 'numba':
+        return VoxelGenerator(
+            voxel_size=voxel_generator_cfg.VOXEL_SIZE,
+            point_cloud_range=point_cloud_range,
+            max_num_points=voxel_generator_cfg.MAX_POINTS_PER_VOXEL,
+            max_voxels=max_voxels
+        )
+    assert name == 'spconv', 'Unknown voxel generator %s' % name
+
+    import spconv
+    # Support spconv 1.0 and 1.1
+    points = np.zeros((1, 3))
+    try:
+        voxel_generator = spconv.utils.VoxelGenerator(
+            voxel_size=voxel_generator_cfg.VOXEL_SIZE,
+            point_cloud_range=point_cloud_range,
+            max_num_points=voxel_generator_cfg.MAX_POINTS_PER_VOXEL,
+            max_voxels=max_voxels
+        )
+        voxels, coordinates, num_points = voxel_generator.generate(points)
+    except:
+        voxel_generator = spconv.utils.VoxelGeneratorV2(
+            voxel_size=voxel_generator_cfg.VOXEL_SIZE,
+            point_cloud_range=point_cloud_range,
+            max_num_points=voxel_generator_cfg.MAX_POINTS_PER_VOXEL,
+            max_voxels=max_voxels
+        )
+        voxel_grid = voxel_generator.generate(points)
+    return voxel_generator
+
+
+if __name__ == '__main__':
+    import time
+
+    points = (np.random.rand(120000, 4) * [80, 80, 4, 1] - [0, 40, 3, 0]).astype(np.float32)
+    voxel_generator = VoxelGenerator(voxel_size=[0.05, 0.05, 0.1], point_cloud_range=[0, -40, -3, 70.4, 40, 1],
+                                     max_num_points=5, max_voxels=16000)
+    voxel_generator.generate(points[:10])  # jit compilation
+    t1 = time.time()
+    voxel_grid = voxel_generator.generate(points)
+    print('numba voxel generator: %.4fs, %d voxels' % (time.time() - t1, voxel_grid['voxels'].shape[0]))
+
+    try:
+        import spconv
+    except ImportError:
+        spconv = None
+    if spconv is not None:
+        spconv_generator = spconv.utils.VoxelGenerator(
+            voxel_size=[0.05, 0.05, 0.1], point_cloud_range=[0, -40, -3, 70.4, 40, 1],
+            max_num_points=5, max_voxels=16000
+        )
+        t1 = time.time()
+        voxels, coordinates, num_points = spconv_generator.generate(points)
+        print('spconv voxel generator: %.4fs, %d voxels' % (time.time() - t1, voxels.shape[0]))
+        assert (voxels == voxel_grid['voxels']).all() and (coordinates == voxel_grid['coordinates']).all()
+        assert (num_points == voxel_grid['num_points_per_voxel']).all()
@@ -75,34 +75,41 @@ class UNetHead(nn.Module):
         part_reg_labels = torch.zeros((points.shape[0], 3)).float()
         bbox_reg_labels = torch.zeros((points.shape[0], 7)).float() if generate_bbox_reg_labels else None
 
-        point_indices = roiaware_pool3d_utils.points_in_boxes_cpu(points, gt_boxes).long()
-        extend_point_indices = roiaware_pool3d_utils.points_in_boxes_cpu(points, extend_gt_boxes).long()
-        for k in range(gt_boxes.shape[0]):
-            fg_pt_flag = point_indices[k] > 0
-            fg_points = points[fg_pt_flag]
-            cls_labels[fg_pt_flag] = gt_classes[k]
-
-            # enlarge the bbox3d, ignore nearby points
-            fg_enlarge_flag = extend_point_indices[k] > 0
-            ignore_flag = fg_pt_flag ^ fg_enlarge_flag
-            cls_labels[ignore_flag] = -1
-
-            # part offset labels
-            transformed_points = fg_points - gt_boxes[k, 0:3]
-            transformed_points = common_utils.rotate_pc_along_z_torch(
-                transformed_points.view(1, -1, 3), -gt_boxes[k, 6]
-            )
-            part_reg_labels[fg_pt_flag] = (transformed_points / gt_boxes[k, 3:6]) + torch.tensor([0.5, 0.5, 0]).float()
-
-            if generate_bbox_reg_labels:
-                # rpn bbox regression target
-                center3d = gt_boxes[k, 0:3].clone()
-                center3d[2] += gt_boxes[k][5] / 2  # shift to center of 3D boxes
-                bbox_reg_labels[fg_pt_flag, 0:3] = center3d - fg_points
-                bbox_reg_labels[fg_pt_flag, 6] = gt_boxes[k, 6]  # dy
-
-                cur_mean_size = torch.tensor(self.mean_size[cfg.CLASS_NAMES[gt_classes[k] - 1]])
-                bbox_reg_labels[fg_pt_flag, 3:6] = (gt_boxes[k, 3:6] - cur_mean_size) / cur_mean_size
+        # the index of the last box that contains each point, as the per-box loop lets the later boxes win
+        num_boxes = gt_boxes.shape[0]
+        box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, gt_boxes.flip(0)).long()
+        extend_box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points, extend_gt_boxes.flip(0)).long()
+        box_idxs_of_pts[box_idxs_of_pts >= 0] = num_boxes - 1 - box_idxs_of_pts[box_idxs_of_pts >= 0]
+        extend_box_idxs_of_pts[extend_box_idxs_of_pts >= 0] = \
+            num_boxes - 1 - extend_box_idxs_of_pts[extend_box_idxs_of_pts >= 0]
+
+        fg_pt_flag = box_idxs_of_pts >= 0
+        fg_points = points[fg_pt_flag]
+        fg_gt_boxes = gt_boxes[box_idxs_of_pts[fg_pt_flag]]
+        fg_gt_classes = gt_classes[box_idxs_of_pts[fg_pt_flag]].long()
+        cls_labels[fg_pt_flag] = fg_gt_classes.int()
+
+        # enlarge the bbox3d, ignore nearby points, also the foreground points of the earlier boxes
+        ignore_flag = extend_box_idxs_of_pts > box_idxs_of_pts
+        cls_labels[ignore_flag] = -1
+
+        # part offset labels
+        transformed_points = fg_points - fg_gt_boxes[:, 0:3]
+        transformed_points = common_utils.rotate_pc_along_z_torch(
+            transformed_points.view(-1, 1, 3), -fg_gt_boxes[:, 6]
+        ).view(-1, 3)
+        part_reg_labels[fg_pt_flag] = (transformed_points / fg_gt_boxes[:, 3:6]) + torch.tensor([0.5, 0.5, 0]).float()
+
+        if generate_bbox_reg_labels:
+            # rpn bbox regression target
+            center3d = fg_gt_boxes[:, 0:3].clone()
+            center3d[:, 2] += fg_gt_boxes[:, 5] / 2  # shift to center of 3D boxes
+            bbox_reg_labels[fg_pt_flag, 0:3] = center3d - fg_points
+            bbox_reg_labels[fg_pt_flag, 6] = fg_gt_boxes[:, 6]  # dy
+
+            mean_size = torch.tensor([self.mean_size[cls_name] for cls_name in cfg.CLASS_NAMES]).float()
+            cur_mean_size = mean_size[fg_gt_classes - 1]
+            bbox_reg_labels[fg_pt_flag, 3:6] = (fg_gt_boxes[:, 3:6] - cur_mean_size) / cur_mean_size
 
         return cls_labels, part_reg_labels, bbox_reg_labels
 
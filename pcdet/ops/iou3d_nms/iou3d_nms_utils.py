@@ -16,9 +16,12 @@ def boxes_iou_bev(boxes_a, boxes_b):
         ans_iou: (M, N)
     """
 
-    ans_iou = torch.cuda.FloatTensor(torch.Size((boxes_a.shape[0], boxes_b.shape[0]))).zero_()
+    ans_iou = boxes_a.new_zeros(torch.Size((boxes_a.shape[0], boxes_b.shape[0])))
 
-    iou3d_nms_cuda.boxes_iou_bev_gpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
+    if boxes_a.is_cuda:
+        iou3d_nms_cuda.boxes_iou_bev_gpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
+    else:
+        iou3d_nms_cuda.boxes_iou_bev_cpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
 
     return ans_iou
 
@@ -30,6 +33,22 @@ def boxes_iou3d_gpu(boxes_a, boxes_b):
     :return:
         ans_iou: (M, N)
     """
+    if not boxes_a.is_cuda:
+        return boxes_iou3d_cpu(boxes_a, boxes_b)
+    return _boxes_iou3d(boxes_a, boxes_b, iou3d_nms_cuda.boxes_overlap_bev_gpu)
+
+
+def boxes_iou3d_cpu(boxes_a, boxes_b):
+    """
+    :param boxes_a: (N, 7) [x, y, z, w, l, h, ry]  in LiDAR
+    :param boxes_b: (M, 7) [x, y, z, h, w, l, ry]
+    :return:
+        ans_iou: (M, N)
+    """
+    return _boxes_iou3d(boxes_a, boxes_b, iou3d_nms_cuda.boxes_overlap_bev_cpu)
+
+
+def _boxes_iou3d(boxes_a, boxes_b, overlap_bev_func):
     boxes_a_bev = box_utils.boxes3d_to_bevboxes_lidar_torch(boxes_a)
     boxes_b_bev = box_utils.boxes3d_to_bevboxes_lidar_torch(boxes_b)
     # height overlap
@@ -39,8 +58,8 @@ def boxes_iou3d_gpu(boxes_a, boxes_b):
     boxes_b_height_min = boxes_b[:, 2].view(1, -1)
 
     # bev overlap
-    overlaps_bev = torch.cuda.FloatTensor(torch.Size((boxes_a.shape[0], boxes_b.shape[0]))).zero_()  # (N, M)
-    iou3d_nms_cuda.boxes_overlap_bev_gpu(boxes_a_bev.contiguous(), boxes_b_bev.contiguous(), overlaps_bev)
+    overlaps_bev = boxes_a.new_zeros(torch.Size((boxes_a.shape[0], boxes_b.shape[0])))  # (N, M)
+    overlap_bev_func(boxes_a_bev.contiguous(), boxes_b_bev.contiguous(), overlaps_bev)
 
     max_of_min = torch.max(boxes_a_height_min, boxes_b_height_min)
     min_of_max = torch.min(boxes_a_height_max, boxes_b_height_max)
@@ -65,6 +84,9 @@ def nms_gpu(boxes, scores, thresh, pre_maxsize=None):
     :return:
     """
     # areas = (x2 - x1) * (y2 - y1)
+    if not boxes.is_cuda:
+        return nms_cpu(boxes, scores, thresh, pre_maxsize=pre_maxsize)
+
     order = scores.sort(0, descending=True)[1]
     if pre_maxsize is not None:
         order = order[:pre_maxsize]
@@ -83,6 +105,9 @@ def nms_normal_gpu(boxes, scores, thresh):
     :param thresh:
     :return:
     """
+    if not boxes.is_cuda:
+        return nms_normal_cpu(boxes, scores, thresh)
+
     # areas = (x2 - x1) * (y2 - y1)
     order = scores.sort(0, descending=True)[1]
 
@@ -93,6 +118,61 @@ def nms_normal_gpu(boxes, scores, thresh):
     return order[keep[:num_out].cuda()].contiguous()
 
 
+def nms_cpu(boxes, scores, thresh, pre_maxsize=None):
+    """
+    :param boxes: (N, 5) [x1, y1, x2, y2, ry]
+    :param scores: (N)
+    :param thresh:
+    :return:
+    """
+    order = scores.sort(0, descending=True)[1]
+    if pre_maxsize is not None:
+        order = order[:pre_maxsize]
+
+    boxes = boxes[order].float().cpu().contiguous()
+
+    keep = torch.LongTensor(boxes.size(0))
+    num_out = iou3d_nms_cuda.nms_cpu(boxes, keep, thresh)
+    return order[keep[:num_out].to(order.device)].contiguous()
+
+
+def nms_normal_cpu(boxes, scores, thresh):
+    """
+    :param boxes: (N, 5) [x1, y1, x2, y2, ry]
+    :param scores: (N)
+    :param thresh:
+    :return:
+    """
+    order = scores.sort(0, descending=True)[1]
+
+    boxes = boxes[order].float().cpu().contiguous()
+
+    keep = torch.LongTensor(boxes.size(0))
+    num_out = iou3d_nms_cuda.nms_normal_cpu(boxes, keep, thresh)
+    return order[keep[:num_out].to(order.device)].contiguous()
+
+
 if __name__ == '__main__':
-    pass
+    import time
+
+    for num_boxes in [1000, 2000, 5000, 10000]:
+        xyz = torch.rand(num_boxes, 3) * torch.tensor([70.4, 80.0, 2.0]) + torch.tensor([0, -40.0, -3.0])
+        wlh = torch.rand(num_boxes, 3) * torch.tensor([1.0, 2.0, 0.5]) + torch.tensor([1.4, 3.4, 1.3])
+        ry = (torch.rand(num_boxes, 1) - 0.5) * 6.28
+        boxes3d, scores = torch.cat([xyz, wlh, ry], dim=1), torch.rand(num_boxes)
+        boxes_bev = box_utils.boxes3d_to_bevboxes_lidar_torch(boxes3d)
+
+        t1 = time.time()
+        iou3d_cpu = boxes_iou3d_cpu(boxes3d, boxes3d)
+        t2 = time.time()
+        keep_cpu = nms_cpu(boxes_bev, scores, 0.1)
+        t3 = time.time()
+        print('num_boxes=%d, boxes_iou3d_cpu: %.2fms, nms_cpu: %.2fms, keep=%d'
+              % (num_boxes, (t2 - t1) * 1000, (t3 - t2) * 1000, keep_cpu.shape[0]))
+
+        if torch.cuda.is_available():
+            iou3d_gpu = boxes_iou3d_gpu(boxes3d.cuda(), boxes3d.cuda()).cpu()
+            keep_gpu = nms_gpu(boxes_bev.cuda(), scores.cuda(), 0.1).cpu()
+            print('max iou3d difference with gpu: %f, same nms results with gpu: %s'
+                  % ((iou3d_cpu - iou3d_gpu).abs().max().item(), torch.equal(keep_cpu, keep_gpu)))
 
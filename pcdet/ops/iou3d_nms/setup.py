@@ -6,9 +6,11 @@ setup(
     ext_modules=[
         CUDAExtension('iou3d_nms_cuda', [
             'src/iou3d_nms.cpp',
+            'src/iou3d_cpu.cpp',
             'src/iou3d_nms_kernel.cu',
         ],
-        extra_compile_args={'cxx': ['-g', '-I /usr/local/cuda/include'],
-                            'nvcc': ['-O2']})
+        extra_compile_args={'cxx': ['-g', '-I /usr/local/cuda/include', '-fopenmp'],
+                            'nvcc': ['-O2']},
+        extra_link_args=['-fopenmp'])
     ],
     cmdclass={'build_ext': BuildExtension})
@@ -34,6 +34,11 @@ void boxesioubevLauncher(const int num_a, const float *boxes_a, const int num_b,
 void nmsLauncher(const float *boxes, unsigned long long * mask, int boxes_num, float nms_overlap_thresh);
 void nmsNormalLauncher(const float *boxes, unsigned long long * mask, int boxes_num, float nms_overlap_thresh);
 
+int boxes_overlap_bev_cpu(at::Tensor boxes_a, at::Tensor boxes_b, at::Tensor ans_overlap);
+int boxes_iou_bev_cpu(at::Tensor boxes_a, at::Tensor boxes_b, at::Tensor ans_iou);
+int nms_cpu(at::Tensor boxes, at::Tensor keep, float nms_overlap_thresh);
+int nms_normal_cpu(at::Tensor boxes, at::Tensor keep, float nms_overlap_thresh);
+
 int boxes_overlap_bev_gpu(at::Tensor boxes_a, at::Tensor boxes_b, at::Tensor ans_overlap){
     // params boxes_a: (N, 5) [x1, y1, x2, y2, ry]
     // params boxes_b: (M, 5) 
@@ -182,5 +187,9 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("boxes_iou_bev_gpu", &boxes_iou_bev_gpu, "oriented boxes iou");
   m.def("nms_gpu", &nms_gpu, "oriented nms gpu");
   m.def("nms_normal_gpu", &nms_normal_gpu, "nms gpu");
+  m.def("boxes_overlap_bev_cpu", &boxes_overlap_bev_cpu, "oriented boxes overlap cpu");
+  m.def("boxes_iou_bev_cpu", &boxes_iou_bev_cpu, "oriented boxes iou cpu");
+  m.def("nms_cpu", &nms_cpu, "oriented nms cpu");
+  m.def("nms_normal_cpu", &nms_normal_cpu, "nms cpu");
 }
 
@@ -98,5 +98,78 @@ def points_in_boxes_cpu(points, boxes):
     return point_indices
 
 
+def points_in_boxes_idx_cpu(points, boxes, return_counts=False):
+    """
+    Compact alternative of points_in_boxes_cpu, only the far-away boxes of each point are skipped by a BEV grid
+    :param points: (npoints, 3)
+    :param boxes: (N, 7) [x, y, z, w, l, h, rz] in LiDAR coordinate, z is the bottom center
+    :param return_counts: bool
+    :return:
+        box_idxs_of_pts: (npoints), index of the first box that contains each point, default background = -1
+        num_boxes_of_pts: (npoints), number of boxes that contain each point, only returned if return_counts
+    """
+    assert boxes.shape[1] == 7
+    assert points.shape[1] == 3
+
+    box_idxs_of_pts = points.new_zeros(points.shape[0], dtype=torch.int).fill_(-1)
+    num_boxes_of_pts = points.new_zeros(points.shape[0], dtype=torch.int)
+    roiaware_pool3d_cuda.points_in_boxes_idx_cpu(
+        boxes.float().contiguous(), points.float().contiguous(), box_idxs_of_pts, num_boxes_of_pts
+    )
+
+    if return_counts:
+        return box_idxs_of_pts, num_boxes_of_pts
+    return box_idxs_of_pts
+
+
+def points_in_boxes_csr_cpu(points, boxes):
+    """
+    Points of each box in CSR format, same result as points_in_boxes_cpu without the dense matrix
+    :param points: (npoints, 3)
+    :param boxes: (N, 7) [x, y, z, w, l, h, rz] in LiDAR coordinate, z is the bottom center
+    :return:
+        box_offsets: (N + 1), the points of box k are pts_idxs[box_offsets[k]:box_offsets[k + 1]]
+        pts_idxs: (M), in increasing order inside each box
+    """
+    box_idxs_of_pts, num_boxes_of_pts = points_in_boxes_idx_cpu(points, boxes, return_counts=True)
+    box_idxs_of_pts, num_boxes_of_pts = box_idxs_of_pts.long(), num_boxes_of_pts.long()
+
+    pts_idxs = (num_boxes_of_pts == 1).nonzero().view(-1)
+    pair_box_idxs = box_idxs_of_pts[pts_idxs]
+
+    multi_pts_idxs = (num_boxes_of_pts > 1).nonzero().view(-1)
+    if multi_pts_idxs.numel() > 0:
+        # the few points inside overlapped boxes are resolved with the dense version
+        multi_point_indices = points_in_boxes_cpu(points[multi_pts_idxs], boxes)  # (N, num_multi_pts)
+        multi_pairs = multi_point_indices.nonzero()
+        pair_box_idxs = torch.cat((pair_box_idxs, multi_pairs[:, 0]), dim=0)
+        pts_idxs = torch.cat((pts_idxs, multi_pts_idxs[multi_pairs[:, 1]]), dim=0)
+
+    order = torch.argsort(pair_box_idxs * points.shape[0] + pts_idxs)
+    pts_idxs = pts_idxs[order]
+    box_offsets = pair_box_idxs.new_zeros(boxes.shape[0] + 1)
+    box_offsets[1:] = torch.cumsum(torch.bincount(pair_box_idxs, minlength=boxes.shape[0]), dim=0)
+
+    return box_offsets, pts_idxs
+
+
 if __name__ == '__main__':
-    pass
+    import time
+    import numpy as np
+
+    points = torch.from_numpy((np.random.rand(120000, 3) * [80, 80, 4] - [0, 40, 3]).astype(np.float32))
+    boxes = torch.from_numpy(np.concatenate((
+        np.random.rand(60, 3) * [70, 70, 1] - [0, 35, 2], np.random.rand(60, 3) * [2, 4, 1.5] + 0.5,
+        np.random.rand(60, 1) * 6.28), axis=1).astype(np.float32))
+
+    t1 = time.time()
+    point_indices = points_in_boxes_cpu(points, boxes)
+    t2 = time.time()
+    box_idxs_of_pts = points_in_boxes_idx_cpu(points, boxes)
+    t3 = time.time()
+    box_offsets, pts_idxs = points_in_boxes_csr_cpu(points, boxes)
+    t4 = time.time()
+    print('dense: %.4fs, idx: %.4fs, csr: %.4fs' % (t2 - t1, t3 - t2, t4 - t3))
+
+    for k in range(boxes.shape[0]):
+        assert (point_indices[k].nonzero().view(-1) == pts_idxs[box_offsets[k]:box_offsets[k + 1]]).all()
@@ -8,12 +8,18 @@ All Rights Reserved 2019.
 #include <torch/serialize/tensor.h>
 #include <torch/extension.h>
 #include <assert.h>
+#include <math.h>
+#include <vector>
+#include <algorithm>
 
 
 #define CHECK_CUDA(x) AT_CHECK(x.type().is_cuda(), #x, " must be a CUDAtensor ")
 #define CHECK_CONTIGUOUS(x) AT_CHECK(x.is_contiguous(), #x, " must be contiguous ")
 #define CHECK_INPUT(x) CHECK_CUDA(x);CHECK_CONTIGUOUS(x)
 
+const float BEV_CELL_SIZE = 2.0;  // meters
+const int MAX_BEV_GRID_SIZE = 512;  // the cells are enlarged if the boxes span a larger area
+
 
 void roiaware_pool3d_launcher(int boxes_num, int pts_num, int channels, int max_pts_each_voxel,
     int out_x, int out_y, int out_z, const float *rois, const float *pts, const float *pts_feature,
@@ -171,9 +177,99 @@ int points_in_boxes_cpu(at::Tensor boxes_tensor, at::Tensor pts_tensor, at::Tens
 
 
 
+int points_in_boxes_idx_cpu(at::Tensor boxes_tensor, at::Tensor pts_tensor, at::Tensor box_idx_of_points_tensor,
+    at::Tensor num_boxes_of_points_tensor){
+    // params boxes: (N, 7) [x, y, z, w, l, h, rz] in LiDAR coordinate, z is the bottom center
+    // params pts: (npoints, 3) [x, y, z] in LiDAR coordinate
+    // params box_idx_of_points: (npoints), default -1, index of the first box that contains each point
+    // params num_boxes_of_points: (npoints), default 0, number of boxes that contain each point
+
+    CHECK_CONTIGUOUS(boxes_tensor);
+    CHECK_CONTIGUOUS(pts_tensor);
+    CHECK_CONTIGUOUS(box_idx_of_points_tensor);
+    CHECK_CONTIGUOUS(num_boxes_of_points_tensor);
+
+    int boxes_num = boxes_tensor.size(0);
+    int pts_num = pts_tensor.size(0);
+
+    const float *boxes = boxes_tensor.data<float>();
+    const float *pts = pts_tensor.data<float>();
+    int *box_idx_of_points = box_idx_of_points_tensor.data<int>();
+    int *num_boxes_of_points = num_boxes_of_points_tensor.data<int>();
+
+    if (boxes_num == 0 || pts_num == 0) return 1;
+
+    // bucket the boxes into a BEV grid by their bounding circles, so that each point only checks nearby boxes
+    std::vector<float> radius(boxes_num);
+    float min_x = INFINITY, min_y = INFINITY, max_x = -INFINITY, max_y = -INFINITY;
+    for (int k = 0; k < boxes_num; k++){
+        const float *box3d = boxes + k * 7;
+        radius[k] = sqrtf(box3d[3] * box3d[3] + box3d[4] * box3d[4]) / 2;
+        min_x = std::min(min_x, box3d[0] - radius[k]);
+        min_y = std::min(min_y, box3d[1] - radius[k]);
+        max_x = std::max(max_x, box3d[0] + radius[k]);
+        max_y = std::max(max_y, box3d[1] + radius[k]);
+    }
+    float cell_size = std::max(BEV_CELL_SIZE, std::max(max_x - min_x, max_y - min_y) / MAX_BEV_GRID_SIZE);
+    int size_x = int((max_x - min_x) / cell_size) + 1;
+    int size_y = int((max_y - min_y) / cell_size) + 1;
+
+    std::vector<int> box_cells(boxes_num * 4);  // [x1, y1, x2, y2] cell range of each box
+    std::vector<int> cell_start(size_x * size_y + 1, 0);
+    for (int k = 0; k < boxes_num; k++){
+        const float *box3d = boxes + k * 7;
+        int *cells = &box_cells[k * 4];
+        cells[0] = int((box3d[0] - radius[k] - min_x) / cell_size);
+        cells[1] = int((box3d[1] - radius[k] - min_y) / cell_size);
+        cells[2] = std::min(int((box3d[0] + radius[k] - min_x) / cell_size), size_x - 1);
+        cells[3] = std::min(int((box3d[1] + radius[k] - min_y) / cell_size), size_y - 1);
+        for (int cx = cells[0]; cx <= cells[2]; cx++){
+            for (int cy = cells[1]; cy <= cells[3]; cy++){
+                cell_start[cx * size_y + cy + 1]++;
+            }
+        }
+    }
+    for (int c = 0; c < size_x * size_y; c++){
+        cell_start[c + 1] += cell_start[c];
+    }
+
+    // boxes are filled in increasing order, so the first hit of a point is its first box
+    std::vector<int> cell_boxes(cell_start[size_x * size_y]);
+    std::vector<int> cell_fill(cell_start.begin(), cell_start.end() - 1);
+    for (int k = 0; k < boxes_num; k++){
+        const int *cells = &box_cells[k * 4];
+        for (int cx = cells[0]; cx <= cells[2]; cx++){
+            for (int cy = cells[1]; cy <= cells[3]; cy++){
+                cell_boxes[cell_fill[cx * size_y + cy]++] = k;
+            }
+        }
+    }
+
+#pragma omp parallel for
+    for (int j = 0; j < pts_num; j++){
+        const float *pt = pts + j * 3;
+        float fx = (pt[0] - min_x) / cell_size, fy = (pt[1] - min_y) / cell_size;
+        if (!(fx >= 0 && fy >= 0 && fx < size_x && fy < size_y)) continue;
+
+        int cell = int(fx) * size_y + int(fy);
+        float local_x = 0, local_y = 0;
+        for (int m = cell_start[cell]; m < cell_start[cell + 1]; m++){
+            int k = cell_boxes[m];
+            if (check_pt_in_box3d_cpu(pt, boxes + k * 7, local_x, local_y)){
+                if (num_boxes_of_points[j] == 0) box_idx_of_points[j] = k;
+                num_boxes_of_points[j]++;
+            }
+        }
+    }
+
+    return 1;
+}
+
+
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
     m.def("forward", &roiaware_pool3d_gpu, "roiaware pool3d forward (CUDA)");
     m.def("backward", &roiaware_pool3d_gpu_backward, "roiaware pool3d backward (CUDA)");
     m.def("points_in_boxes_gpu", &points_in_boxes_gpu, "points_in_boxes_gpu forward (CUDA)");
     m.def("points_in_boxes_cpu", &points_in_boxes_cpu, "points_in_boxes_cpu forward (CUDA)");
+    m.def("points_in_boxes_idx_cpu", &points_in_boxes_idx_cpu, "points_in_boxes_idx_cpu forward (CPU)");
 }
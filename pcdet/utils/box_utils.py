@@ -1,25 +1,131 @@
 import numpy as np
+import numba
 import torch
-from scipy.spatial import Delaunay
-import scipy
 from ..ops.roiaware_pool3d import roiaware_pool3d_utils
 
 
-def in_hull(p, hull):
+@numba.njit
+def _build_bev_box_grid(boxes3d, cell_size, max_grid_size):
     """
-    :param p: (N, K) test points
-    :param hull: (M, K) M corners of a box
-    :return (N) bool
+    Bucket the BEV bounding rectangles of the boxes into a regular grid
+    :return:
+        grid_params: (5) [min_x, min_y, cell_size, size_x, size_y]
+        cell_start: (size_x * size_y + 1), the boxes of cell c are cell_boxes[cell_start[c]:cell_start[c + 1]]
+        cell_boxes: (M) box indices, increasing inside each cell
     """
-    try:
-        if not isinstance(hull, Delaunay):
-            hull = Delaunay(hull)
-        flag = hull.find_simplex(p) >= 0
-    except scipy.spatial.qhull.QhullError:
-        print('Warning: not a hull %s' % str(hull))
-        flag = np.zeros(p.shape[0], dtype=np.bool)
-
-    return flag
+    num_boxes = boxes3d.shape[0]
+    radius = np.sqrt(boxes3d[:, 3] ** 2 + boxes3d[:, 4] ** 2) / 2
+    min_x, min_y = (boxes3d[:, 0] - radius).min(), (boxes3d[:, 1] - radius).min()
+    max_x, max_y = (boxes3d[:, 0] + radius).max(), (boxes3d[:, 1] + radius).max()
+    cell_size = max(cell_size, (max_x - min_x) / max_grid_size, (max_y - min_y) / max_grid_size)
+    size_x = int((max_x - min_x) / cell_size) + 1
+    size_y = int((max_y - min_y) / cell_size) + 1
+
+    box_cells = np.zeros((num_boxes, 4), dtype=np.int64)  # [x1, y1, x2, y2] cell range of each box
+    cell_start = np.zeros(size_x * size_y + 1, dtype=np.int64)
+    for k in range(num_boxes):
+        box_cells[k, 0] = int((boxes3d[k, 0] - radius[k] - min_x) / cell_size)
+        box_cells[k, 1] = int((boxes3d[k, 1] - radius[k] - min_y) / cell_size)
+        box_cells[k, 2] = min(int((boxes3d[k, 0] + radius[k] - min_x) / cell_size), size_x - 1)
+        box_cells[k, 3] = min(int((boxes3d[k, 1] + radius[k] - min_y) / cell_size), size_y - 1)
+        for cx in range(box_cells[k, 0], box_cells[k, 2] + 1):
+            for cy in range(box_cells[k, 1], box_cells[k, 3] + 1):
+                cell_start[cx * size_y + cy + 1] += 1
+    cell_start = np.cumsum(cell_start)
+
+    cell_boxes = np.zeros(cell_start[-1], dtype=np.int64)
+    cell_fill = cell_start[:-1].copy()
+    for k in range(num_boxes):
+        for cx in range(box_cells[k, 0], box_cells[k, 2] + 1):
+            for cy in range(box_cells[k, 1], box_cells[k, 3] + 1):
+                cell_boxes[cell_fill[cx * size_y + cy]] = k
+                cell_fill[cx * size_y + cy] += 1
+
+    grid_params = np.array([min_x, min_y, cell_size, size_x, size_y], dtype=np.float64)
+    return grid_params, cell_start, cell_boxes
+
+
+@numba.njit(parallel=True)
+def _points_in_boxes_idx_kernel(points, boxes3d, grid_params, cell_start, cell_boxes, box_idxs):
+    min_x, min_y, cell_size = grid_params[0], grid_params[1], grid_params[2]
+    size_x, size_y = int(grid_params[3]), int(grid_params[4])
+    cosa, sina = np.cos(boxes3d[:, 6]), np.sin(boxes3d[:, 6])
+    for i in numba.prange(points.shape[0]):
+        fx = (points[i, 0] - min_x) / cell_size
+        fy = (points[i, 1] - min_y) / cell_size
+        if fx < 0 or fy < 0 or fx >= size_x or fy >= size_y:
+            continue
+        cell = int(fx) * size_y + int(fy)
+        for m in range(cell_start[cell], cell_start[cell + 1]):
+            k = cell_boxes[m]
+            shift_z = points[i, 2] - boxes3d[k, 2]
+            if shift_z < 0 or shift_z > boxes3d[k, 5]:
+                continue
+            shift_x = points[i, 0] - boxes3d[k, 0]
+            shift_y = points[i, 1] - boxes3d[k, 1]
+            local_x = shift_x * cosa[k] - shift_y * sina[k]
+            local_y = shift_x * sina[k] + shift_y * cosa[k]
+            if abs(local_x) <= boxes3d[k, 3] / 2 and abs(local_y) <= boxes3d[k, 4] / 2:
+                box_idxs[i] = k
+                break
+
+
+def points_in_boxes_idx(points, boxes3d, cell_size=2.0, max_grid_size=512):
+    """
+    Analytic check of the points against the local frame of each box, all boxes are checked in one pass
+    :param points: (N, 3 + C) in LiDAR coords
+    :param boxes3d: (M, 7) [x, y, z, w, l, h, ry] in LiDAR coords, z is the bottom center
+    :param cell_size: float, size of the BEV grid cells used to skip far-away boxes
+    :param max_grid_size: int, the cells are enlarged if the boxes span more than max_grid_size cells
+    :return box_idxs: (N) int32, index of the first box that contains each point, -1 for background points
+    """
+    box_idxs = -np.ones(points.shape[0], dtype=np.int32)
+    if points.shape[0] == 0 or boxes3d.shape[0] == 0:
+        return box_idxs
+    boxes3d = np.ascontiguousarray(boxes3d[:, 0:7], dtype=np.float64)
+    grid_params, cell_start, cell_boxes = _build_bev_box_grid(boxes3d, cell_size, max_grid_size)
+    _points_in_boxes_idx_kernel(points, boxes3d, grid_params, cell_start, cell_boxes, box_idxs)
+    return box_idxs
+
+
+@numba.njit
+def _points_in_boxes_count_kernel(points, boxes3d, grid_params, cell_start, cell_boxes, box_counts):
+    min_x, min_y, cell_size = grid_params[0], grid_params[1], grid_params[2]
+    size_x, size_y = int(grid_params[3]), int(grid_params[4])
+    cosa, sina = np.cos(boxes3d[:, 6]), np.sin(boxes3d[:, 6])
+    for i in range(points.shape[0]):
+        fx = (points[i, 0] - min_x) / cell_size
+        fy = (points[i, 1] - min_y) / cell_size
+        if fx < 0 or fy < 0 or fx >= size_x or fy >= size_y:
+            continue
+        cell = int(fx) * size_y + int(fy)
+        for m in range(cell_start[cell], cell_start[cell + 1]):
+            k = cell_boxes[m]
+            shift_z = points[i, 2] - boxes3d[k, 2]
+            if shift_z < 0 or shift_z > boxes3d[k, 5]:
+                continue
+            shift_x = points[i, 0] - boxes3d[k, 0]
+            shift_y = points[i, 1] - boxes3d[k, 1]
+            local_x = shift_x * cosa[k] - shift_y * sina[k]
+            local_y = shift_x * sina[k] + shift_y * cosa[k]
+            if abs(local_x) <= boxes3d[k, 3] / 2 and abs(local_y) <= boxes3d[k, 4] / 2:
+                box_counts[k] += 1
+
+
+def points_in_boxes_count(points, boxes3d, cell_size=2.0, max_grid_size=512):
+    """
+    Same membership test as points_in_boxes_idx, but a point inside several boxes is counted for each of them
+    :param points: (N, 3 + C) in LiDAR coords
+    :param boxes3d: (M, 7) [x, y, z, w, l, h, ry] in LiDAR coords, z is the bottom center
+    :return box_counts: (M) int32, number of points inside each box
+    """
+    box_counts = np.zeros(boxes3d.shape[0], dtype=np.int32)
+    if points.shape[0] == 0 or boxes3d.shape[0] == 0:
+        return box_counts
+    boxes3d = np.ascontiguousarray(boxes3d[:, 0:7], dtype=np.float64)
+    grid_params, cell_start, cell_boxes = _build_bev_box_grid(boxes3d, cell_size, max_grid_size)
+    _points_in_boxes_count_kernel(points, boxes3d, grid_params, cell_start, cell_boxes, box_counts)
+    return box_counts
 
 
 def boxes3d_to_corners3d_lidar_torch(boxes3d, bottom_center=True):
@@ -228,10 +334,10 @@ def remove_points_in_boxes3d(points, boxes3d):
     :param boxes3d: (N, 7) [x, y, z, w, l, h, rz] in LiDAR coordinate, z is the bottom center, each box DO NOT overlaps
     :return:
     """
-    point_masks = roiaware_pool3d_utils.points_in_boxes_cpu(
+    box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(
         torch.from_numpy(points[:, 0:3]), torch.from_numpy(boxes3d)
     ).numpy()
-    return points[point_masks.sum(axis=0) == 0]
+    return points[box_idxs_of_pts == -1]
 
 
 def boxes3d_to_bevboxes_lidar_torch(boxes3d):
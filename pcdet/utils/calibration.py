@@ -1,3 +1,4 @@
+import numba
 import numpy as np
 
 
@@ -20,6 +21,39 @@ def get_calib_from_file(calib_file):
             'Tr_velo2cam': Tr_velo_to_cam.reshape(3, 4)}
 
 
+def get_calib_from_info(calib_info):
+    """
+    :param calib_info: info['calib'] generated by get_infos, {'P2', 'R0_rect', 'Tr_velo_to_cam'} of (4, 4)
+    :return: same format as get_calib_from_file
+    """
+    return {'P2': np.array(calib_info['P2'][0:3], dtype=np.float32),
+            'R0': np.array(calib_info['R0_rect'][0:3, 0:3], dtype=np.float32),
+            'Tr_velo2cam': np.array(calib_info['Tr_velo_to_cam'][0:3], dtype=np.float32)}
+
+
+@numba.njit(error_model='numpy')
+def _fov_points_kernel(pts_lidar, V2R, P2, img_h, img_w, fov_idxs):
+    """
+    lidar_to_rect + rect_to_img + the checks of get_fov_flag of each point in one pass, no temporary arrays
+    """
+    num_fov = 0
+    for i in range(pts_lidar.shape[0]):
+        x, y, z = pts_lidar[i, 0], pts_lidar[i, 1], pts_lidar[i, 2]
+        rect_x = x * V2R[0, 0] + y * V2R[0, 1] + z * V2R[0, 2] + V2R[0, 3]
+        rect_y = x * V2R[1, 0] + y * V2R[1, 1] + z * V2R[1, 2] + V2R[1, 3]
+        rect_z = x * V2R[2, 0] + y * V2R[2, 1] + z * V2R[2, 2] + V2R[2, 3]
+
+        img_z = rect_x * P2[2, 0] + rect_y * P2[2, 1] + rect_z * P2[2, 2] + P2[2, 3]
+        if img_z - P2[2, 3] < 0:
+            continue
+        u = (rect_x * P2[0, 0] + rect_y * P2[0, 1] + rect_z * P2[0, 2] + P2[0, 3]) / rect_z
+        v = (rect_x * P2[1, 0] + rect_y * P2[1, 1] + rect_z * P2[1, 2] + P2[1, 3]) / rect_z
+        if u >= 0 and u < img_w and v >= 0 and v < img_h:
+            fov_idxs[num_fov] = i
+            num_fov += 1
+    return num_fov
+
+
 class Calibration(object):
     def __init__(self, calib_file):
         if isinstance(calib_file, str):
@@ -39,6 +73,26 @@ class Calibration(object):
         self.tx = self.P2[0, 3] / (-self.fu)
         self.ty = self.P2[1, 3] / (-self.fv)
 
+        # (3, 4) affine transforms [R | t], computed once instead of in every call
+        V2R = np.dot(self.R0, self.V2C)
+        R0_ext = np.eye(4, dtype=np.float32)
+        R0_ext[0:3, 0:3] = self.R0
+        V2C_ext = np.eye(4, dtype=np.float32)
+        V2C_ext[0:3] = self.V2C
+        self.V2R = V2R.astype(np.float32)  # lidar -> rect
+        self.R2V = np.linalg.inv(np.dot(R0_ext, V2C_ext))[0:3].astype(np.float32)  # rect -> lidar
+
+    @staticmethod
+    def affine_transform(pts, affine):
+        """
+        :param pts: (N, 3 + C), only the first 3 columns are used
+        :param affine: (3, 4) [R | t]
+        :return pts_new: (N, 3), R * pts + t without building the homogeneous points
+        """
+        pts_new = np.dot(pts[:, 0:3], affine[:, 0:3].T)
+        pts_new += affine[:, 3]
+        return pts_new
+
     def cart_to_hom(self, pts):
         """
         :param pts: (N, 3 or 2)
@@ -52,35 +106,24 @@ class Calibration(object):
         :param pts_lidar: (N, 3)
         :return pts_rect: (N, 3)
         """
-        pts_rect_hom = self.cart_to_hom(pts_rect)  # (N, 4)
-        R0_ext = np.hstack((self.R0, np.zeros((3, 1), dtype=np.float32)))  # (3, 4)
-        R0_ext = np.vstack((R0_ext, np.zeros((1, 4), dtype=np.float32)))  # (4, 4)
-        R0_ext[3, 3] = 1
-        V2C_ext = np.vstack((self.V2C, np.zeros((1, 4), dtype=np.float32)))  # (4, 4)
-        V2C_ext[3, 3] = 1
-
-        pts_lidar = np.dot(pts_rect_hom, np.linalg.inv(np.dot(R0_ext, V2C_ext).T))
-        return pts_lidar[:, 0:3]
+        return self.affine_transform(pts_rect, self.R2V)
 
     def lidar_to_rect(self, pts_lidar):
         """
         :param pts_lidar: (N, 3)
         :return pts_rect: (N, 3)
         """
-        pts_lidar_hom = self.cart_to_hom(pts_lidar)
-        pts_rect = np.dot(pts_lidar_hom, np.dot(self.V2C.T, self.R0.T))
-        # pts_rect = reduce(np.dot, (pts_lidar_hom, self.V2C.T, self.R0.T))
-        return pts_rect
+        return self.affine_transform(pts_lidar, self.V2R)
 
     def rect_to_img(self, pts_rect):
         """
         :param pts_rect: (N, 3)
         :return pts_img: (N, 2)
         """
-        pts_rect_hom = self.cart_to_hom(pts_rect)
-        pts_2d_hom = np.dot(pts_rect_hom, self.P2.T)
-        pts_img = (pts_2d_hom[:, 0:2].T / pts_rect_hom[:, 2]).T  # (N, 2)
-        pts_rect_depth = pts_2d_hom[:, 2] - self.P2.T[3, 2]  # depth in rect camera coord
+        pts_2d_hom = self.affine_transform(pts_rect, self.P2)
+        pts_img = pts_2d_hom[:, 0:2]
+        pts_img /= pts_rect[:, 2:3]  # (N, 2)
+        pts_rect_depth = pts_2d_hom[:, 2] - self.P2[2, 3]  # depth in rect camera coord
         return pts_img, pts_rect_depth
 
     def lidar_to_img(self, pts_lidar):
@@ -92,6 +135,17 @@ class Calibration(object):
         pts_img, pts_depth = self.rect_to_img(pts_rect)
         return pts_img, pts_depth
 
+    def lidar_to_fov_idxs(self, pts_lidar, img_shape):
+        """
+        Fused version of lidar_to_rect + get_fov_flag of the datasets
+        :param pts_lidar: (N, 3 + C)
+        :param img_shape: [H, W]
+        :return fov_idxs: (M) int64, indices of the points in the image with a non-negative depth
+        """
+        fov_idxs = np.empty(pts_lidar.shape[0], dtype=np.int64)
+        num_fov = _fov_points_kernel(pts_lidar, self.V2R, self.P2, img_shape[0], img_shape[1], fov_idxs)
+        return fov_idxs[:num_fov]
+
     def img_to_rect(self, u, v, depth_rect):
         """
         :param u: (N)
@@ -123,3 +177,44 @@ class Calibration(object):
         boxes_corner = np.concatenate((x.reshape(-1, 8, 1), y.reshape(-1, 8, 1)), axis=2)
 
         return boxes, boxes_corner
+
+
+if __name__ == '__main__':
+    import time
+    import tracemalloc
+
+    calib = Calibration({
+        'P2': np.array([[721.5377, 0, 609.5593, 44.85728], [0, 721.5377, 172.854, 0.2163791],
+                        [0, 0, 1, 0.002745884]], dtype=np.float32),
+        'R0': np.array([[0.9999239, 0.00983776, -0.007445048], [-0.009869795, 0.9999421, -0.004278459],
+                        [0.007402527, 0.004351614, 0.9999631]], dtype=np.float32),
+        'Tr_velo2cam': np.array([[0.007533745, -0.9999714, -0.000616602, -0.004069766],
+                                 [0.01480249, 0.0007280733, -0.9998902, -0.07631618],
+                                 [0.9998621, 0.00752379, 0.01480755, -0.2717806]], dtype=np.float32)
+    })
+    img_shape = np.array([375, 1242], dtype=np.int32)
+    points = (np.random.rand(120000, 4) * [160, 160, 4, 1] - [80, 80, 3, 0]).astype(np.float32)
+    calib.lidar_to_fov_idxs(points[:10], img_shape)  # jit compilation
+
+    def get_fov_flag(pts_rect):
+        pts_img, pts_rect_depth = calib.rect_to_img(pts_rect)
+        val_flag_1 = np.logical_and(pts_img[:, 0] >= 0, pts_img[:, 0] < img_shape[1])
+        val_flag_2 = np.logical_and(pts_img[:, 1] >= 0, pts_img[:, 1] < img_shape[0])
+        return np.logical_and(np.logical_and(val_flag_1, val_flag_2), pts_rect_depth >= 0)
+
+    tracemalloc.start()
+    t1 = time.time()
+    for _ in range(10):
+        points_fov = points[get_fov_flag(calib.lidar_to_rect(points[:, 0:3]))]
+    t2 = time.time()
+    peak_numpy = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    for _ in range(10):
+        points_fused = points[calib.lidar_to_fov_idxs(points, img_shape)]
+    t3 = time.time()
+    peak_fused = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print('numpy: %.2fms, peak %.1fMB per frame' % ((t2 - t1) * 100, peak_numpy / 2 ** 20))
+    print('fused: %.2fms, peak %.1fMB per frame' % ((t3 - t2) * 100, peak_fused / 2 ** 20))
+    print('%d points in fov, same points: %s' % (points_fov.shape[0], np.array_equal(points_fov, points_fused)))
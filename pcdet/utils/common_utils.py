@@ -6,6 +6,8 @@ import torch.multiprocessing as mp
 import torch.distributed as dist
 import subprocess
 import random
+import multiprocessing
+import tqdm
 
 
 def rotate_pc_along_z(pc, rot_angle):
@@ -167,3 +169,31 @@ def set_random_seed(seed):
     torch.manual_seed(seed)
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = False
+
+
+def process_pool_map(func, iterable, num_workers=4, chunksize=None, desc=None):
+    """
+    Ordered map over a process pool with a progress bar, runs in the current process if num_workers <= 1
+    :param func: picklable function of one argument, e.g. a bound method wrapped by functools.partial
+    :param iterable:
+    :param num_workers: int
+    :param chunksize: int, number of items sent to a worker at once, default ~16 chunks per worker
+    :param desc: str, description of the progress bar
+    :return results: list, in the same order as iterable
+    """
+    items = list(iterable)
+    if chunksize is None:
+        chunksize = max(len(items) // (max(num_workers, 1) * 16), 1)
+
+    results = []
+    with tqdm.tqdm(total=len(items), desc=desc, dynamic_ncols=True) as pbar:
+        if num_workers <= 1:
+            for item in items:
+                results.append(func(item))
+                pbar.update()
+        else:
+            with multiprocessing.Pool(num_workers) as pool:
+                for ret in pool.imap(func, items, chunksize=chunksize):
+                    results.append(ret)
+                    pbar.update()
+    return results
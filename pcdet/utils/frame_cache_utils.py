@@ -0,0 +1,129 @@
+import os
+import atexit
+import pickle
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+
+HITS, MISSES, EVICTIONS, NUM_BYTES = range(4)
+CACHE_DIR_PREFIX = 'pcdet_frame_cache_'
+
+
+def remove_stale_cache_dirs(cache_root):
+    """
+    Remove the cache directories left by the killed runs, the owner pid is a part of the directory name
+    :param cache_root: directory of the caches
+    """
+    for entry in os.scandir(cache_root):
+        if not entry.name.startswith(CACHE_DIR_PREFIX):
+            continue
+        try:
+            owner_pid = int(entry.name[len(CACHE_DIR_PREFIX):].split('_')[0])
+            os.kill(owner_pid, 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            shutil.rmtree(entry.path, ignore_errors=True)
+        except PermissionError:
+            continue  # alive, owned by another user
+
+
+class SharedLRUCache(object):
+    def __init__(self, max_bytes, cache_root='/dev/shm', evict_ratio=0.9):
+        """
+        LRU cache of decoded frames shared by the DataLoader workers. Each entry is a file in a RAM-backed
+        directory (np.ndarray as .npy, memory-mapped on reading, anything else pickled), the byte counter and the
+        statistics live in shared memory. The cache must be created before the workers are started.
+        :param max_bytes: int, byte budget of the cache
+        :param cache_root: RAM-backed file system, falls back to the default temporary directory if not available
+        :param evict_ratio: the least recently used entries are evicted until max_bytes * evict_ratio bytes are left
+        """
+        self.max_bytes = int(max_bytes)
+        self.evict_ratio = evict_ratio
+        cache_root = cache_root if os.path.isdir(cache_root) else tempfile.gettempdir()
+        remove_stale_cache_dirs(cache_root)
+        self.owner_pid = os.getpid()
+        self.cache_dir = tempfile.mkdtemp(prefix='%s%d_' % (CACHE_DIR_PREFIX, self.owner_pid), dir=cache_root)
+        self.lock = multiprocessing.Lock()
+        self.stats = multiprocessing.RawArray('q', 4)  # guarded by self.lock
+        atexit.register(self.cleanup)
+
+    def get(self, key, load_func, *args):
+        """
+        :param key: str, unique file name of the entry
+        :param load_func: called with *args on a miss, None results are not cached
+        :return: cached value, np.ndarray values are read-only
+        """
+        val = self._read(key)
+        with self.lock:
+            self.stats[HITS if val is not None else MISSES] += 1
+        if val is None:
+            val = load_func(*args)
+            if val is not None:
+                self._write(key, val)
+        return val
+
+    def _read(self, key):
+        for suffix in ['.npy', '.pkl']:
+            file_path = os.path.join(self.cache_dir, key + suffix)
+            try:
+                if suffix == '.npy':
+                    val = np.load(file_path, mmap_mode='r')
+                else:
+                    with open(file_path, 'rb') as f:
+                        val = pickle.load(f)
+                os.utime(file_path)  # the modification time is the last access time of the LRU
+                return val
+            except (FileNotFoundError, EOFError):
+                continue  # not cached or evicted by another worker
+        return None
+
+    def _write(self, key, val):
+        suffix = '.npy' if isinstance(val, np.ndarray) else '.pkl'
+        file_path = os.path.join(self.cache_dir, key + suffix)
+        tmp_path = '%s.tmp.%d' % (file_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            if suffix == '.npy':
+                np.save(f, val)
+            else:
+                pickle.dump(val, f)
+        num_bytes = os.path.getsize(tmp_path)
+
+        with self.lock:
+            if num_bytes > self.max_bytes or os.path.exists(file_path):
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, file_path)
+            self.stats[NUM_BYTES] += num_bytes
+            if self.stats[NUM_BYTES] > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = [x for x in os.scandir(self.cache_dir) if '.tmp.' not in x.name]
+        entries.sort(key=lambda x: x.stat().st_mtime_ns)
+        for entry in entries:
+            if self.stats[NUM_BYTES] <= self.max_bytes * self.evict_ratio:
+                break
+            num_bytes = entry.stat().st_size
+            os.remove(entry.path)  # the workers still mapping the file keep their pages
+            self.stats[NUM_BYTES] -= num_bytes
+            self.stats[EVICTIONS] += 1
+
+    def get_stats(self):
+        """
+        :return: dict of hits, misses, evictions, num_bytes and hit_rate of all the workers
+        """
+        with self.lock:
+            hits, misses, evictions, num_bytes = self.stats[:]
+        return {
+            'hits': hits, 'misses': misses, 'evictions': evictions, 'num_bytes': num_bytes,
+            'hit_rate': hits / max(hits + misses, 1)
+        }
+
+    def cleanup(self):
+        if os.getpid() == self.owner_pid:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def __del__(self):
+        self.cleanup()
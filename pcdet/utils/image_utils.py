@@ -0,0 +1,62 @@
+import struct
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# start of frame markers of the baseline, progressive and lossless JPEGs (not DHT 0xC4, JPG 0xC8 or DAC 0xCC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _read_jpeg_shape(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] == 0xFF:  # fill byte
+            f.seek(-1, 1)
+            continue
+        if marker[1] in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):  # markers without a segment
+            continue
+        segment_length = struct.unpack('>H', f.read(2))[0]
+        if marker[1] in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return height, width
+        f.seek(segment_length - 2, 1)
+
+
+def get_image_shape(img_file):
+    """
+    Read the height and width from the PNG / JPEG header without decoding the image, other formats are decoded
+    by skimage
+    :param img_file: path of the image
+    :return: (2) int32 [H, W]
+    """
+    with open(img_file, 'rb') as f:
+        header = f.read(24)
+        shape = None
+        if header[:8] == PNG_SIGNATURE and header[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', header[16:24])
+            shape = (height, width)
+        elif header[:2] == b'\xff\xd8':
+            shape = _read_jpeg_shape(f)
+
+    if shape is None:
+        from skimage import io
+        shape = io.imread(img_file).shape[:2]
+    return np.array(shape, dtype=np.int32)
+
+
+def get_image_shapes(img_files, num_workers=8):
+    """
+    :param img_files: list of image paths
+    :param num_workers: int, number of threads reading the headers
+    :return: (N, 2) int32 [H, W]
+    """
+    img_files = list(img_files)
+    if num_workers <= 1 or len(img_files) <= 1:
+        shapes = [get_image_shape(x) for x in img_files]
+    else:
+        with ThreadPool(num_workers) as pool:
+            shapes = pool.map(get_image_shape, img_files)
+    return np.array(shapes, dtype=np.int32).reshape(-1, 2)
@@ -0,0 +1,111 @@
+import pickle
+import bisect
+import numpy as np
+from pathlib import Path
+
+RAGGED_KEYS = ['annos']  # per-object fields, concatenated along axis 0 with an offsets array per field
+
+
+def get_store_path(info_path):
+    """kitti_infos_train.pkl -> kitti_infos_train_store/"""
+    info_path = Path(info_path)
+    return info_path.parent / (info_path.stem + '_store')
+
+
+def _flatten_info(info, prefix=()):
+    for key, val in info.items():
+        if isinstance(val, dict):
+            yield from _flatten_info(val, prefix + (key,))
+        else:
+            yield prefix + (key,), val
+
+
+def create_info_store(store_path, infos):
+    """
+    Save a list of nested info dicts as one .npy file per field, so that the infos can be memory-mapped
+    :param store_path: directory of the store
+    :param infos: list of dict, all the infos must have the same fields
+    """
+    store_path = Path(store_path)
+    store_path.mkdir(parents=True, exist_ok=True)
+
+    columns = {}
+    for k, info in enumerate(infos):
+        flat_info = dict(_flatten_info(info))
+        if k == 0:
+            columns = {keys: [] for keys in flat_info.keys()}
+        assert flat_info.keys() == columns.keys(), 'all the infos should have the same fields'
+        for keys, val in flat_info.items():
+            columns[keys].append(np.asarray(val))
+
+    fields = {}
+    for keys, values in columns.items():
+        name = '.'.join(keys)
+        ragged = keys[0] in RAGGED_KEYS
+        if ragged:
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([val.shape[0] for val in values])
+            data = np.concatenate(values, axis=0)
+            np.save(str(store_path / ('%s.offsets.npy' % name)), offsets)
+        else:
+            data = np.stack(values, axis=0)
+        assert data.dtype != np.object_, 'field %s cannot be memory-mapped' % name
+        np.save(str(store_path / ('%s.npy' % name)), data)
+        fields[name] = {'keys': keys, 'ragged': ragged}
+
+    with open(store_path / 'meta.pkl', 'wb') as f:
+        pickle.dump({'num_infos': len(infos), 'fields': fields}, f)
+
+
+class InfoStore(object):
+    def __init__(self, store_paths):
+        """
+        List-like read access to the infos of one or several stores written by create_info_store. All the columns
+        are memory-mapped, each info is a nested dict of read-only views created on access.
+        :param store_paths: list of store directories, their infos are concatenated in order
+        """
+        self.stores = []
+        self.start_indices = []
+        num_infos = 0
+        for store_path in store_paths:
+            store_path = Path(store_path)
+            with open(store_path / 'meta.pkl', 'rb') as f:
+                meta = pickle.load(f)
+            columns = {}
+            for name, field in meta['fields'].items():
+                data = np.load(str(store_path / ('%s.npy' % name)), mmap_mode='r')
+                offsets = np.load(str(store_path / ('%s.offsets.npy' % name))) if field['ragged'] else None
+                columns[name] = (field['keys'], data, offsets)
+            self.stores.append(columns)
+            self.start_indices.append(num_infos)
+            num_infos += meta['num_infos']
+        self.num_infos = num_infos
+
+    def __len__(self):
+        return self.num_infos
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num_infos
+        if not 0 <= index < self.num_infos:
+            raise IndexError('info index %d out of range' % index)
+        store_idx = bisect.bisect_right(self.start_indices, index) - 1
+        local_idx = index - self.start_indices[store_idx]
+
+        info = {}
+        for keys, data, offsets in self.stores[store_idx].values():
+            if offsets is not None:
+                val = data[offsets[local_idx]:offsets[local_idx + 1]]
+            else:
+                val = data[local_idx]
+                if np.ndim(val) == 0:
+                    val = val.item()  # python str / int / float as in the pickled infos
+            cur_dict = info
+            for key in keys[:-1]:
+                cur_dict = cur_dict.setdefault(key, {})
+            cur_dict[keys[-1]] = val
+        return info
+
+    def __iter__(self):
+        for index in range(self.num_infos):
+            yield self[index]
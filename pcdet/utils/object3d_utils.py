@@ -8,17 +8,134 @@ def get_objects_from_label(label_file):
     return objects
 
 
+def get_objects3d_from_label(label_file):
+    """
+    :param label_file: KITTI label file
+    :return: Objects3d, same objects as get_objects_from_label in one structured array
+    """
+    return Objects3d.from_annos(get_annos_from_label(label_file))
+
+
+def get_annos_from_label(label_file):
+    """
+    :param label_file: KITTI label file
+    :return annos: dict of columns, same values as get_objects_from_label
+        name: (N) str
+        truncated, occluded, alpha, rotation_y: (N) float64
+        bbox: (N, 4) [x1, y1, x2, y2]
+        dimensions: (N, 3) lhw(camera) format
+        location: (N, 3)
+        difficulty: (N) int32, 0: Easy, 1: Moderate, 2: Hard, -1: UnKnown
+        score: (N), only if the label has the score column
+    """
+    return get_annos_from_labels([label_file])[0]
+
+
+def get_annos_from_labels(label_files):
+    """
+    Columnar parsing of a batch of label files, the numbers of all the files are parsed by one np.fromstring
+    :param label_files: list of KITTI label files
+    :return: list of annos, see get_annos_from_label
+    """
+    names_list, numbers_list, num_fields_list = [], [], []
+    for label_file in label_files:
+        with open(label_file, 'r') as f:
+            lines = [line.split(None, 1) for line in f.read().splitlines() if line.strip()]
+        names_list.append(np.array([x[0] for x in lines]))
+        numbers_list.extend([x[1] for x in lines])
+        num_fields_list.append(len(lines[0][1].split()) if len(lines) > 0 else 14)
+
+    values = np.fromstring(' '.join(numbers_list), sep=' ')
+    num_values = [len(names) * num_fields for names, num_fields in zip(names_list, num_fields_list)]
+    assert values.shape[0] == sum(num_values), 'all the lines of a label file should have the same fields'
+    values_list = [x.reshape(-1, num_fields) for x, num_fields in
+                   zip(np.split(values, np.cumsum(num_values)[:-1]), num_fields_list)]
+
+    if len(set(num_fields_list)) == 1:
+        all_values = values.reshape(-1, num_fields_list[0])
+        all_levels = get_kitti_obj_levels(all_values[:, 3:7], all_values[:, 0], all_values[:, 1])
+        levels_list = np.split(all_levels, np.cumsum([len(x) for x in names_list])[:-1])
+    else:
+        levels_list = [get_kitti_obj_levels(x[:, 3:7], x[:, 0], x[:, 1]) for x in values_list]
+
+    annos_list = []
+    for names, values, levels in zip(names_list, values_list, levels_list):
+        annos = {
+            'name': names,
+            'truncated': values[:, 0],
+            'occluded': values[:, 1],
+            'alpha': values[:, 2],
+            'bbox': values[:, 3:7],
+            'dimensions': values[:, [9, 7, 8]],  # hwl -> lhw(camera) format
+            'location': values[:, 10:13],
+            'rotation_y': values[:, 13],
+            'difficulty': levels
+        }
+        if values.shape[1] == 15:
+            annos['score'] = values[:, 14]
+        annos_list.append(annos)
+    return annos_list
+
+
+def get_kitti_obj_levels(bbox, truncation, occlusion):
+    """
+    vectorized Object3d.get_kitti_obj_level
+    :return: (N) int32, 0: Easy, 1: Moderate, 2: Hard, -1: UnKnown
+    """
+    box2d = bbox.astype(np.float32).astype(np.float64)  # Object3d.box2d is float32
+    height = box2d[:, 3] - box2d[:, 1] + 1
+    levels = np.full(height.shape[0], -1, dtype=np.int32)
+    hard = (height >= 25) & (truncation <= 0.5) & (occlusion <= 2)
+    moderate = (height >= 25) & (truncation <= 0.3) & (occlusion <= 1)
+    easy = (height >= 40) & (truncation <= 0.15) & (occlusion <= 0)
+    levels[hard] = 2
+    levels[moderate] = 1
+    levels[easy] = 0
+    return levels
+
+
+TYPE_TO_ID = {'Car': 1, 'Pedestrian': 2, 'Cyclist': 3, 'Van': 4}
+LEVEL_TO_STR = {0: 'Easy', 1: 'Moderate', 2: 'Hard', -1: 'UnKnown'}
+OBJECT3D_DTYPE = np.dtype([
+    ('cls_type', 'U16'), ('cls_id', 'i1'), ('truncation', 'f8'), ('occlusion', 'f8'), ('alpha', 'f8'),
+    ('box2d', 'f4', (4, )), ('h', 'f8'), ('w', 'f8'), ('l', 'f8'), ('loc', 'f4', (3, )), ('ry', 'f8'),
+    ('score', 'f8'), ('level', 'i1')
+])
+
+
 def cls_type_to_id(cls_type):
-    type_to_id = {'Car': 1, 'Pedestrian': 2, 'Cyclist': 3, 'Van': 4}
-    if cls_type not in type_to_id.keys():
+    if cls_type not in TYPE_TO_ID.keys():
         return -1
-    return type_to_id[cls_type]
+    return TYPE_TO_ID[cls_type]
 
 
 class Object3d(object):
+    __slots__ = ('cls_type', 'cls_id', 'truncation', 'occlusion', 'alpha', 'box2d', 'h', 'w', 'l', 'loc',
+                 'dis_to_cam', 'ry', 'score', 'level_str', 'level')
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        :param record: one element of an OBJECT3D_DTYPE array
+        """
+        obj = cls.__new__(cls)
+        obj.cls_type = str(record['cls_type'])
+        obj.cls_id = int(record['cls_id'])
+        obj.truncation = float(record['truncation'])
+        obj.occlusion = float(record['occlusion'])
+        obj.alpha = float(record['alpha'])
+        obj.box2d = np.array(record['box2d'], dtype=np.float32)
+        obj.h, obj.w, obj.l = float(record['h']), float(record['w']), float(record['l'])
+        obj.loc = np.array(record['loc'], dtype=np.float32)
+        obj.dis_to_cam = np.linalg.norm(obj.loc)
+        obj.ry = float(record['ry'])
+        obj.score = float(record['score'])
+        obj.level = int(record['level'])
+        obj.level_str = LEVEL_TO_STR[obj.level]
+        return obj
+
     def __init__(self, line):
         label = line.strip().split(' ')
-        self.src = line
         self.cls_type = label[0]
         self.cls_id = cls_type_to_id(self.cls_type)
         self.truncation = float(label[1])
@@ -82,3 +199,80 @@ class Object3d(object):
                        self.ry)
         return kitti_str
 
+
+class Objects3d(object):
+    def __init__(self, data):
+        """
+        Batch of objects in one OBJECT3D_DTYPE structured array, about 160 bytes per object
+        :param data: (N) OBJECT3D_DTYPE
+        """
+        self.data = data
+
+    @classmethod
+    def from_annos(cls, annos):
+        """
+        :param annos: output of get_annos_from_label
+        """
+        num_objects = len(annos['name'])
+        data = np.zeros(num_objects, dtype=OBJECT3D_DTYPE)
+        data['cls_type'] = annos['name']
+        data['cls_id'] = -1
+        for cls_type, cls_id in TYPE_TO_ID.items():
+            data['cls_id'][data['cls_type'] == cls_type] = cls_id
+        data['truncation'] = annos['truncated']
+        data['occlusion'] = annos['occluded']
+        data['alpha'] = annos['alpha']
+        data['box2d'] = annos['bbox']
+        data['l'], data['h'], data['w'] = annos['dimensions'].T  # lhw(camera) format
+        data['loc'] = annos['location']
+        data['ry'] = annos['rotation_y']
+        data['score'] = annos.get('score', -1.0)
+        data['level'] = annos['difficulty']
+        return cls(data)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, index):
+        """
+        :param index: str for a column, int for an Object3d, slice / mask / indices for an Objects3d
+        """
+        if isinstance(index, str):
+            return self.data[index]
+        if isinstance(index, (int, np.integer)):
+            return Object3d.from_record(self.data[index])
+        return Objects3d(self.data[index])
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def generate_corners3d(self):
+        """
+        vectorized Object3d.generate_corners3d
+        :return corners_3d: (N, 8, 3) corners of box3d in camera coord
+        """
+        l, h, w = self.data['l'][:, None], self.data['h'][:, None], self.data['w'][:, None]
+        x_corners = l / 2 * np.array([1, 1, -1, -1, 1, 1, -1, -1], dtype=np.float64)
+        y_corners = -h * np.array([0, 0, 0, 0, 1, 1, 1, 1], dtype=np.float64)
+        z_corners = w / 2 * np.array([1, -1, -1, 1, 1, -1, -1, 1], dtype=np.float64)
+
+        cosa, sina = np.cos(self.data['ry'])[:, None], np.sin(self.data['ry'])[:, None]
+        corners3d = np.stack([cosa * x_corners + sina * z_corners, y_corners, -sina * x_corners + cosa * z_corners],
+                             axis=2)  # (N, 8, 3)
+        corners3d = corners3d + self.data['loc'][:, None, :]
+        return corners3d
+
+    def to_kitti_format(self):
+        """
+        :return: list of str, same as Object3d.to_kitti_format of each object
+        """
+        values = np.concatenate([
+            np.stack([self.data['truncation'], self.data['occlusion'].astype(np.int64), self.data['alpha']], axis=1),
+            self.data['box2d'].astype(np.float64),
+            np.stack([self.data['h'], self.data['w'], self.data['l']], axis=1),
+            self.data['loc'].astype(np.float64), self.data['ry'][:, None]
+        ], axis=1)
+        kitti_format = '%s %.2f %d ' + ' '.join(['%.2f'] * 12)
+        return [kitti_format % ((cls_type, ) + tuple(row)) for cls_type, row in
+                zip(self.data['cls_type'].tolist(), values.tolist())]
@@ -0,0 +1,97 @@
+import pickle
+import numpy as np
+from pathlib import Path
+from functools import partial
+from . import common_utils
+
+# 7 bytes per point instead of 16: fixed-point xyz and the [0, 1] intensity scaled to [0, 255]
+QUANTIZED_POINT_DTYPE = np.dtype([('xyz', '<i2', (3, )), ('intensity', 'u1')])
+MANIFEST_NAME = 'quantization.pkl'
+
+
+def quantize_points(points, resolution=0.01):
+    """
+    The decoding error is bounded by resolution / 2 (plus float32 rounding) for x, y, z, i.e. 5mm for the default
+    1cm, one tenth of the 5cm voxels of the configs, and by 1 / 510 for the intensity. The xyz range is
+    +-32767 * resolution (327m for 1cm).
+    :param points: (N, 4) [x, y, z, intensity], intensity in [0, 1]
+    :param resolution: float, quantization step of x, y, z in meters
+    :return qpoints: (N) QUANTIZED_POINT_DTYPE
+    """
+    xyz = np.round(points[:, 0:3].astype(np.float64) / resolution)
+    assert np.abs(xyz).max(initial=0) <= np.iinfo(np.int16).max, \
+        'points out of the range of int16, please use a larger resolution'
+    qpoints = np.empty(points.shape[0], dtype=QUANTIZED_POINT_DTYPE)
+    qpoints['xyz'] = xyz
+    qpoints['intensity'] = np.round(np.clip(points[:, 3], 0, 1) * 255)
+    return qpoints
+
+
+def dequantize_points(qpoints, resolution=0.01):
+    """
+    :param qpoints: (N) QUANTIZED_POINT_DTYPE
+    :param resolution: float, the resolution used by quantize_points
+    :return points: (N, 4) float32 [x, y, z, intensity]
+    """
+    points = np.empty((qpoints.shape[0], 4), dtype=np.float32)
+    np.multiply(qpoints['xyz'], np.float32(resolution), out=points[:, 0:3])
+    np.multiply(qpoints['intensity'], np.float32(1.0 / 255), out=points[:, 3])
+    return points
+
+
+def load_quantized_points(file_path, resolution=0.01):
+    return dequantize_points(np.fromfile(file_path, dtype=QUANTIZED_POINT_DTYPE), resolution)
+
+
+def get_quantized_resolution(quant_dir):
+    """
+    :param quant_dir: directory written by convert_to_quantized
+    :return: float, None if the directory is not converted
+    """
+    manifest_file = Path(quant_dir) / MANIFEST_NAME
+    if not manifest_file.exists():
+        return None
+    with open(manifest_file, 'rb') as f:
+        return pickle.load(f)['resolution']
+
+
+def convert_single_file(src_file, quant_dir, resolution=0.01, num_features=4, chunk_size=2 ** 20):
+    """
+    :return max_error: (2) max abs error of x, y, z and of the intensity
+    """
+    points = np.memmap(str(src_file), dtype=np.float32, mode='r').reshape(-1, num_features)
+    max_error = np.zeros(2, dtype=np.float64)
+    with open(Path(quant_dir) / Path(src_file).name, 'wb') as f:
+        # packed gt databases may not fit into memory
+        for start in range(0, points.shape[0], chunk_size):
+            cur_points = np.array(points[start:start + chunk_size])
+            qpoints = quantize_points(cur_points, resolution)
+            qpoints.tofile(f)
+            error = np.abs(dequantize_points(qpoints, resolution) - cur_points)
+            max_error = np.maximum(max_error, [error[:, 0:3].max(initial=0), error[:, 3].max(initial=0)])
+    return max_error
+
+
+def convert_to_quantized(src_files, quant_dir, resolution=0.01, num_features=4, num_workers=4):
+    """
+    Convert float32 point files (frames, gt objects or packed gt databases) into QUANTIZED_POINT_DTYPE files of
+    the same names in quant_dir, the resolution is saved in the manifest of quant_dir
+    :param src_files: list of .bin files, the rows are [x, y, z, intensity]
+    :param quant_dir: output directory
+    :param resolution: float, quantization step of x, y, z in meters
+    :param num_features: only 4 is supported
+    :param num_workers: int
+    :return max_error: (2) max abs error of x, y, z and of the intensity
+    """
+    assert num_features == 4, 'only [x, y, z, intensity] points can be quantized'
+    quant_dir = Path(quant_dir)
+    quant_dir.mkdir(parents=True, exist_ok=True)
+
+    process_func = partial(convert_single_file, quant_dir=quant_dir, resolution=resolution, num_features=num_features)
+    errors = common_utils.process_pool_map(process_func, [str(x) for x in src_files], num_workers=num_workers,
+                                           desc=quant_dir.name)
+    max_error = np.max(np.array(errors).reshape(-1, 2), axis=0, initial=0)
+
+    with open(quant_dir / MANIFEST_NAME, 'wb') as f:
+        pickle.dump({'resolution': resolution, 'dtype': QUANTIZED_POINT_DTYPE.descr}, f)
+    return max_error
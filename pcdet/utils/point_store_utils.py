@@ -0,0 +1,87 @@
+import pickle
+import numpy as np
+from pathlib import Path
+
+
+def get_index_path(data_file):
+    return Path(data_file).with_suffix('.pkl')
+
+
+def create_packed_point_store(data_file, sample_id_list, load_points_func, num_features=4, crop=None):
+    """
+    Pack the point clouds of several frames into one contiguous float32 blob plus an offsets index
+    :param data_file: path of the packed blob, the index is saved next to it with the suffix .pkl
+    :param sample_id_list: list of sample indices (str)
+    :param load_points_func: function, sample_idx -> (N, num_features) points
+    :param num_features: int
+    :param crop: dict, parameters of the cropping done by load_points_func, saved in the index as the manifest
+    :return:
+        offsets: (num_samples + 1), the points of sample k are rows [offsets[k], offsets[k + 1])
+    """
+    data_file = Path(data_file)
+    data_file.parent.mkdir(parents=True, exist_ok=True)
+
+    offsets = np.zeros(len(sample_id_list) + 1, dtype=np.int64)
+    with open(data_file, 'wb') as f:
+        for k, sample_idx in enumerate(sample_id_list):
+            points = np.ascontiguousarray(load_points_func(sample_idx), dtype=np.float32)
+            assert points.shape[1] == num_features
+            points.tofile(f)
+            offsets[k + 1] = offsets[k] + points.shape[0]
+
+    store_index = {
+        'sample_id_list': list(sample_id_list),
+        'offsets': offsets,
+        'num_features': num_features,
+        'dtype': 'float32',
+        'crop': crop
+    }
+    with open(get_index_path(data_file), 'wb') as f:
+        pickle.dump(store_index, f)
+    return offsets
+
+
+class PackedPointStore(object):
+    def __init__(self, data_file):
+        """
+        Read-only access to a blob written by create_packed_point_store. The blob is mapped lazily, so that
+        all DataLoader workers share the same page cache instead of re-reading and re-allocating each frame.
+        :param data_file: path of the packed blob
+        """
+        self.data_file = str(data_file)
+        with open(get_index_path(data_file), 'rb') as f:
+            store_index = pickle.load(f)
+
+        self.offsets = store_index['offsets']
+        self.num_features = store_index['num_features']
+        self.dtype = np.dtype(store_index['dtype'])
+        self.crop = store_index.get('crop', None)
+        self.sample_id_to_pos = {sample_idx: k for k, sample_idx in enumerate(store_index['sample_id_list'])}
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = np.memmap(self.data_file, dtype=self.dtype, mode='r',
+                                   shape=(int(self.offsets[-1]), self.num_features))
+        return self._data
+
+    def __len__(self):
+        return len(self.sample_id_to_pos)
+
+    def __contains__(self, sample_idx):
+        return sample_idx in self.sample_id_to_pos
+
+    def __getitem__(self, sample_idx):
+        """
+        :param sample_idx: str
+        :return points: (N, num_features), zero-copy read-only view of the packed blob
+        """
+        k = self.sample_id_to_pos[sample_idx]
+        return self.data[self.offsets[k]:self.offsets[k + 1]]
+
+    def __getstate__(self):
+        # memmaps are re-opened in each process instead of being pickled
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
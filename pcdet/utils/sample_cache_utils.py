@@ -0,0 +1,59 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from pathlib import Path
+
+
+def get_config_hash(*configs):
+    """
+    :param configs: EasyDict / dict / list, anything that changes the cached samples
+    :return: str, md5 of the json dump of the configs
+    """
+    config_str = json.dumps(configs, sort_keys=True, default=str)
+    return hashlib.md5(config_str.encode('utf-8')).hexdigest()
+
+
+class SampleCache(object):
+    def __init__(self, cache_dir, config_hash):
+        """
+        On-disk cache of deterministic prepare_data outputs, one directory of .npy files per frame, so that the
+        cached arrays are memory-mapped on reading
+        :param cache_dir: root directory of the cache
+        :param config_hash: str, the samples of different configs are saved in different sub-directories
+        """
+        self.cache_path = Path(cache_dir) / config_hash
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def load(self, sample_idx):
+        """
+        :param sample_idx: str
+        :return example: dict of read-only arrays, None if the frame is not cached yet
+        """
+        sample_path = self.cache_path / str(sample_idx)
+        if not sample_path.exists():
+            return None
+        example = {}
+        for array_file in sample_path.glob('*.npy'):
+            example[array_file.stem] = np.load(str(array_file), mmap_mode='r')
+        return example
+
+    def save(self, sample_idx, example):
+        """
+        :param sample_idx: str
+        :param example: dict, only the np.ndarray values are cached
+        """
+        sample_path = self.cache_path / str(sample_idx)
+        if sample_path.exists():
+            return
+        # several DataLoader workers may write the cache at the same time, the frame directory is renamed at last
+        tmp_path = self.cache_path / ('%s.tmp.%d' % (sample_idx, os.getpid()))
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        for key, val in example.items():
+            if isinstance(val, np.ndarray):
+                np.save(str(tmp_path / ('%s.npy' % key)), val)
+        try:
+            os.rename(str(tmp_path), str(sample_path))
+        except OSError:
+            shutil.rmtree(str(tmp_path), ignore_errors=True)  # already saved by another process
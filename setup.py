@@ -16,7 +16,9 @@ def get_git_commit_number():
 def make_cuda_ext(name, module, sources):
     cuda_ext = CUDAExtension(
         name='%s.%s' % (module, name),
-        sources=[os.path.join(*module.split('.'), src) for src in sources]
+        sources=[os.path.join(*module.split('.'), src) for src in sources],
+        extra_compile_args={'cxx': ['-fopenmp'], 'nvcc': []},
+        extra_link_args=['-fopenmp']
     )
     return cuda_ext
 
@@ -54,6 +56,7 @@ if __name__ == '__main__':
                 module='pcdet.ops.iou3d_nms',
                 sources=[
                     'src/iou3d_nms.cpp',
+                    'src/iou3d_cpu.cpp',
                     'src/iou3d_nms_kernel.cu'
                 ]
             ),
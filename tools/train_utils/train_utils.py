@@ -81,6 +81,11 @@ def train_model(model, optimizer, train_loader, model_func, lr_scheduler, optim_
                 leave_pbar=(cur_epoch + 1 == total_epochs)
             )
 
+            frame_cache = getattr(train_loader.dataset, 'frame_cache', None)
+            if frame_cache is not None and rank == 0 and tb_log is not None:
+                for key, val in frame_cache.get_stats().items():
+                    tb_log.add_scalar('frame_cache_' + key, val, accumulated_iter)
+
             # save trained model
             trained_epoch = cur_epoch + 1
             if trained_epoch % ckpt_save_interval == 0 and rank == 0: